@@ -1,11 +1,16 @@
 # librerías importadas
 
 import cv2
+import multiprocessing
+import os
 import numpy as np
 import pygame
+import queue
 import threading
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 # Constantes - visualización
 
@@ -18,16 +23,90 @@ GAUSSIAN_KERNEL: tuple = (15, 15)
 MIN_FIRE_AREA: int = 2000
 
 
+# constantes - análisis
+
+# Escala de la imagen de análisis respecto a VIDEO_WIDTH x VIDEO_HEIGHT (1.0 = completa).
+# El kernel de desenfoque y MIN_FIRE_AREA se reescalan en consecuencia.
+ANALYSIS_SCALE: float = 1.0
+# Si es True, cada candidato hallado a escala reducida se confirma y ajusta a resolución completa.
+COARSE_TO_FINE: bool = False
+
+
+# Si es True la segmentación (desenfoque, HSV y máscara) se reparte en TILE_GRID
+# (columnas, filas) teselas procesadas en paralelo; pensado para cámaras 4K.
+TILED_SEGMENTATION: bool = False
+TILE_GRID: tuple = (2, 2)
+TILE_WORKERS: int = os.cpu_count() or 1
+
+
+# constantes - detección de movimiento
+
+# Si es True solo se segmenta el color en las regiones que cambiaron respecto al fotograma
+# anterior, se omiten los fotogramas sin movimiento y se descartan las regiones que no parpadean.
+MOTION_GATE: bool = False
+MOTION_SCALE: float = 0.25
+MOTION_THRESHOLD: int = 20
+MOTION_MIN_PIXELS: int = 30
+# Margen añadido a cada región en movimiento, como fracción de su tamaño, para abarcar
+# el interior de la llama, que cambia menos que su borde.
+MOTION_PADDING: float = 0.5
+# Actividad de parpadeo: media exponencial de la máscara de movimiento (0..255).
+FLICKER_ALPHA: float = 0.2
+FLICKER_ACTIVITY: float = 25.0
+FLICKER_MIN_RATIO: float = 0.05
+
+
 # constantes - audio
 
 ALARM_SOUND: str = "fire-alarm.mp3"
 PRE_ALARM_SOUND: str = "pre-alarm.mp3"
 
 
-# Umbrales para la alerta escalonada
+# constantes - fuentes de video
+
+# Índices de cámara, archivos de video o URLs (p. ej. RTSP). Con más de una fuente cada
+# flujo se analiza en su propio proceso. También pueden pasarse como argumentos.
+VIDEO_SOURCES: list = [0]
+STREAM_REPORT_INTERVAL: float = 5.0
+# Un flujo que no envía eventos (los fps llegan cada segundo) durante este tiempo se da por
+# finalizado: su proceso pudo morir (segfault de OpenCV, OOM) sin avisar.
+STREAM_STALL_SECONDS: float = 10.0
+
+
+# constantes - grabación de evidencias
+
+# Si es True se conservan los últimos PRE_EVENT_SECONDS de fotogramas procesados en un
+# búfer circular de memoria fija y cada escalada guarda un clip en CLIP_DIR.
+CLIP_RECORDING: bool = False
+CLIP_DIR: str = "clips"
+CLIP_FPS: int = 10
+CLIP_SCALE: float = 0.5
+PRE_EVENT_SECONDS: float = 5.0
+POST_EVENT_SECONDS: float = 5.0
+
+
+# constantes - pipeline
 
-ALERTA_THRESHOLD = 5
-ALARMA_THRESHOLD = 15
+# Si es True captura, análisis y visualización corren en etapas separadas unidas por
+# colas que solo conservan el fotograma más reciente.
+PIPELINE_MODE: bool = False
+LATENCY_REPORT_INTERVAL: float = 5.0
+
+
+# Umbrales para la alerta escalonada (segundos de detección sostenida)
+
+ALERTA_SECONDS: float = 0.5
+ALARMA_SECONDS: float = 1.5
+
+
+# constantes - planificación
+
+# Si el análisis ocupa más de CPU_BUDGET del intervalo entre fotogramas de la cámara se
+# analiza solo uno de cada N fotogramas (como máximo MAX_FRAME_SKIP seguidos sin analizar).
+ADAPTIVE_SKIP: bool = True
+CPU_BUDGET: float = 0.8
+MAX_FRAME_SKIP: int = 5
+DEFAULT_CAMERA_FPS: float = 30.0
 
 # Rangos de color HSV
 
@@ -43,66 +122,266 @@ FIRE_UPPER2 = np.array([25, 255, 255], dtype="uint8")
 FIRE_LOWER3 = np.array([26, 200, 230], dtype="uint8")
 FIRE_UPPER3 = np.array([35, 255, 255], dtype="uint8")
 
+# Para añadir un rango basta con declarar FIRE_LOWER4/FIRE_UPPER4, etc.:
+# la tabla de clasificación se construye con todos los pares FIRE_LOWER*/FIRE_UPPER*.
+
+# Si es True la máscara se obtiene directamente del BGR difuminado con una LUT de
+# 24 bits (16 MB) y se omite la conversión a HSV; conviene donde cvtColor es caro.
+# Si es False se usa una LUT de 256 entradas por canal sobre la imagen HSV.
+FIRE_MASK_FROM_BGR: bool = False
+
 
 # Variables de estado
 
 estado_alarma: bool = False
-alarma_hilo: threading.Thread = None
-alarma_activa: threading.Event = threading.Event()
-deteccion_continua: int = 0
 nivel_alarma: str = "OFF"
 
 
 # Funciones de audio
 
-#  Ejecuta en un hilo separado para manejar la reproducción del sonido de la alarma.
-def audio_loop():
-    try:
-        pygame.mixer.init()
-        current_sound_loaded = None
-        while alarma_activa.is_set():
-            if nivel_alarma == "ALERT" and current_sound_loaded != "ALERT":
-                pygame.mixer.music.stop()
-                pygame.mixer.music.load(PRE_ALARM_SOUND)
-                pygame.mixer.music.play(-1)
-                current_sound_loaded = "ALERT"
-            elif nivel_alarma == "ALARM" and current_sound_loaded != "ALARM":
-                pygame.mixer.music.stop()
-                pygame.mixer.music.load(ALARM_SOUND)
-                pygame.mixer.music.play(-1)
-                current_sound_loaded = "ALARM"
-            elif nivel_alarma == "OFF" and current_sound_loaded != "OFF":
-                pygame.mixer.music.stop()
-                current_sound_loaded = "OFF"
-            time.sleep(0.5)
-    except pygame.error as e:
-        print(f"Error en el hilo de audio: {e}")
-    finally:
-        if pygame.mixer.get_init():
-            pygame.mixer.music.stop()
-            pygame.mixer.quit()
+class AlarmController:
+    """
+    Controlador de la alarma sonora.
+    Mantiene los sonidos decodificados en memoria y cambia de sonido en cuanto se
+    notifica un cambio de nivel, sin sondeo. Para pruebas sin tarjeta de sonido
+    basta con ejecutar con SDL_AUDIODRIVER=dummy.
+    """
+
+    def __init__(self, sounds):
+        self.sounds = sounds
+        self.latencies = []
+        self._cond = threading.Condition()
+        self._nivel = "OFF"
+        self._solicitado = 0.0
+        self._activo = False
+        self._listo = threading.Event()
+        self._hilo = None
+
+    def is_alive(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def start(self):
+        """Inicia el hilo de audio y espera a que los sonidos estén cargados."""
+        self._activo = True
+        self._hilo = threading.Thread(target=self._run, daemon=True)
+        self._hilo.start()
+        self._listo.wait()
 
+    def set_level(self, nivel):
+        with self._cond:
+            self._nivel = nivel
+            self._solicitado = time.perf_counter()
+            self._cond.notify()
 
-# inicia el proceso de reproducción de audio
+    def stop(self):
+        with self._cond:
+            self._activo = False
+            self._cond.notify()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def _run(self):
+        canal = None
+        try:
+            pygame.mixer.init()
+            sonidos = {nivel: pygame.mixer.Sound(ruta) for nivel, ruta in self.sounds.items()}
+            canal = pygame.mixer.Channel(0)
+            actual = "OFF"
+            self._listo.set()
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: not self._activo or self._nivel != actual)
+                    if not self._activo:
+                        break
+                    nivel, solicitado = self._nivel, self._solicitado
+
+                canal.stop()
+                if nivel in sonidos:
+                    canal.play(sonidos[nivel], loops=-1)
+                actual = nivel
+                latencia = time.perf_counter() - solicitado
+                self.latencies.append(latencia)
+                estado = f"{nivel} activo" if nivel in sonidos else "detenido"
+                print(f"Evento: Sonido {estado} {latencia * 1000:.1f} ms después del cambio de nivel.")
+        except pygame.error as e:
+            print(f"Error en el hilo de audio: {e}")
+        finally:
+            self._listo.set()
+            if pygame.mixer.get_init():
+                if canal is not None:
+                    canal.stop()
+                pygame.mixer.quit()
+
+
+alarma_sonora: AlarmController = None
+
+
+# inicia el hilo de audio y precarga los sonidos de alarma.
 def start_audio_thread():
-    global alarma_hilo
-    if not alarma_hilo or not alarma_hilo.is_alive():
-        alarma_activa.set()
-        alarma_hilo = threading.Thread(target=audio_loop)
-        alarma_hilo.start()
+    global alarma_sonora
+    if not alarma_sonora or not alarma_sonora.is_alive():
+        alarma_sonora = AlarmController({"ALERT": PRE_ALARM_SOUND, "ALARM": ALARM_SOUND})
+        alarma_sonora.start()
         print("Evento: Hilo de audio iniciado.")
 
 
 # detiene de forma segura el hilo de reproducción de audio.
 def stop_audio_thread():
-    global alarma_hilo, nivel_alarma
-    if alarma_hilo and alarma_hilo.is_alive():
-        alarma_activa.clear()
+    global nivel_alarma
+    if alarma_sonora and alarma_sonora.is_alive():
         nivel_alarma = "OFF"
-        alarma_hilo.join()
+        alarma_sonora.stop()
         print("Evento: Hilo de audio detenido.")
 
 
+# Clasificación de color
+
+# devuelve todos los rangos FIRE_LOWER<n>/FIRE_UPPER<n> declarados en el módulo, ordenados por n.
+def fire_ranges():
+    indices = sorted(
+        int(name[len("FIRE_LOWER"):]) for name in globals()
+        if name.startswith("FIRE_LOWER") and name[len("FIRE_LOWER"):].isdigit()
+    )
+    return [(globals()[f"FIRE_LOWER{i}"], globals()[f"FIRE_UPPER{i}"]) for i in indices]
+
+
+class FireColorLUT:
+    """
+    Clasificador de color de fuego precalculado.
+    Fusiona todos los rangos HSV en tablas de consulta construidas una sola vez,
+    de modo que la máscara combinada se obtiene en una pasada por fotograma.
+    """
+
+    def __init__(self, ranges, from_bgr=False):
+        self.ranges = [(np.asarray(lo, dtype=np.uint8), np.asarray(up, dtype=np.uint8))
+                       for lo, up in ranges]
+        self.hsv_luts = self._build_hsv_luts()
+        self.bgr_lut = self._build_bgr_lut() if from_bgr else None
+
+    def _build_hsv_luts(self):
+        # Un bit por rango en cada canal: el píxel pertenece al rango i si el bit i
+        # está activo en H, S y V a la vez. Cada grupo de tablas admite hasta 8 rangos.
+        luts = []
+        for start in range(0, len(self.ranges), 8):
+            lut = np.zeros((3, 256), dtype=np.uint8)
+            for bit, (lower, upper) in enumerate(self.ranges[start:start + 8]):
+                for c in range(3):
+                    lut[c, lower[c]:int(upper[c]) + 1] |= np.uint8(1 << bit)
+            luts.append(lut)
+        return luts
+
+    def _build_bgr_lut(self):
+        # Tabla indexada por B | G << 8 | R << 16; se construye un plano de R a la vez
+        # para no reservar la imagen completa de 2^24 colores.
+        lut = np.empty(1 << 24, dtype=np.uint8)
+        g, b = np.mgrid[0:256, 0:256].astype(np.uint8)
+        plane = np.empty((256, 256, 3), dtype=np.uint8)
+        plane[..., 0] = b
+        plane[..., 1] = g
+        for r in range(256):
+            plane[..., 2] = r
+            lut[r << 16:(r + 1) << 16] = self.mask_from_hsv(
+                cv2.cvtColor(plane, cv2.COLOR_BGR2HSV)).ravel()
+        return lut
+
+    def mask_from_hsv(self, hsv):
+        """Máscara 0/255 de los píxeles HSV que caen en alguno de los rangos."""
+        channels = cv2.split(hsv)
+        mask = None
+        for lut in self.hsv_luts:
+            h, s, v = (cv2.LUT(ch, lut[c]) for c, ch in enumerate(channels))
+            bits = cv2.bitwise_and(cv2.bitwise_and(h, s), v)
+            mask = bits if mask is None else cv2.bitwise_or(mask, bits)
+        if mask is None:
+            return np.zeros(hsv.shape[:2], dtype=np.uint8)
+        return cv2.compare(mask, 0, cv2.CMP_GT)
+
+    def mask_from_bgr(self, bgr):
+        """Máscara 0/255 calculada directamente desde BGR, sin convertir a HSV."""
+        if self.bgr_lut is None:
+            self.bgr_lut = self._build_bgr_lut()
+        packed = cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA).view(np.uint32)[..., 0]
+        np.bitwise_and(packed, 0xFFFFFF, out=packed)
+        return np.take(self.bgr_lut, packed)
+
+
+fire_lut: FireColorLUT = None
+
+
+# construye (una única vez) el clasificador a partir de los rangos declarados.
+def get_fire_lut():
+    global fire_lut
+    if fire_lut is None:
+        fire_lut = FireColorLUT(fire_ranges(), from_bgr=FIRE_MASK_FROM_BGR)
+    return fire_lut
+
+
+# Detección de movimiento
+
+class MotionGate:
+    """
+    Compuerta de movimiento por diferencia de fotogramas sobre una imagen reducida.
+    Devuelve las regiones que cambiaron y mantiene un mapa de actividad para
+    distinguir el parpadeo de una llama de un objeto naranja estático.
+    """
+
+    def __init__(self, scale=MOTION_SCALE):
+        self.scale = scale
+        self.prev = None
+        self.activity = None
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        # Regiones de fuego del último fotograma analizado, para los fotogramas sin movimiento.
+        self.blobs = np.empty(0, dtype=FIRE_BLOB_DTYPE)
+
+    def update(self, frame):
+        """Devuelve las regiones en movimiento (x, y, w, h) en coordenadas de frame."""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self.prev is None or self.prev.shape != gray.shape:
+            self.prev = gray
+            self.activity = np.zeros(gray.shape, dtype=np.float32)
+            return []
+
+        diff = cv2.absdiff(gray, self.prev)
+        self.prev = gray
+        _, moving = cv2.threshold(diff, MOTION_THRESHOLD, 255, cv2.THRESH_BINARY)
+        cv2.accumulateWeighted(moving, self.activity, FLICKER_ALPHA)
+        if cv2.countNonZero(moving) < MOTION_MIN_PIXELS:
+            return []
+
+        moving = cv2.dilate(moving, self.kernel, iterations=2)
+        contours, _ = cv2.findContours(moving, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        inv = 1.0 / self.scale
+        height, width = frame.shape[:2]
+        regions = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            pad_x, pad_y = w * MOTION_PADDING, h * MOTION_PADDING
+            x0, y0 = max(int((x - pad_x) * inv), 0), max(int((y - pad_y) * inv), 0)
+            x1 = min(int(np.ceil((x + w + pad_x) * inv)), width)
+            y1 = min(int(np.ceil((y + h + pad_y) * inv)), height)
+            regions.append((x0, y0, x1 - x0, y1 - y0))
+        return regions
+
+    def flicker_ratio(self, box):
+        """Fracción de píxeles con actividad de parpadeo dentro de una caja en coordenadas de frame."""
+        x, y, w, h = (int(v * self.scale) for v in box)
+        roi = self.activity[y:y + max(h, 1), x:x + max(w, 1)]
+        if roi.size == 0:
+            return 0.0
+        return cv2.countNonZero(cv2.compare(roi, FLICKER_ACTIVITY, cv2.CMP_GT)) / roi.size
+
+
+motion_gate: MotionGate = None
+
+
+def get_motion_gate():
+    global motion_gate
+    if motion_gate is None:
+        motion_gate = MotionGate()
+    return motion_gate
+
+
 # Procesamiento de imagen
 
 # estandariza y optimiza la imagen para el análisis posterior.
@@ -111,90 +390,787 @@ def preprocess_frame(frame):
     return cv2.convertScaleAbs(frame, alpha=CONTRAST, beta=BRIGHTNESS)
 
 
-# ajusta el contraste y el brillo del fotograma.
-def apply_blur_and_hsv(frame):
-    blur = cv2.GaussianBlur(frame, GAUSSIAN_KERNEL, 0)
-    return cv2.cvtColor(blur, cv2.COLOR_BGR2HSV)
+# suaviza el fotograma para reducir el ruido antes de clasificar el color.
+def apply_blur(frame, kernel=GAUSSIAN_KERNEL):
+    return cv2.GaussianBlur(frame, kernel, 0)
+
+
+# kernel de desenfoque equivalente a GAUSSIAN_KERNEL a la escala indicada (siempre impar).
+def scaled_kernel(scale):
+    return tuple(max(1, int(round(k * scale))) | 1 for k in GAUSSIAN_KERNEL)
+
+
+# desenfoca y pasa al espacio de color que espera el clasificador.
+def blur_for_analysis(frame, kernel=GAUSSIAN_KERNEL):
+    blur = apply_blur(frame, kernel)
+    return blur if FIRE_MASK_FROM_BGR else cv2.cvtColor(blur, cv2.COLOR_BGR2HSV)
+
+
+# prepara la imagen de análisis, reducida a la escala indicada (ANALYSIS_SCALE por defecto)
+# y en el espacio de color que espera el clasificador.
+def prepare_analysis(frame, scale=None):
+    scale = ANALYSIS_SCALE if scale is None else scale
+    if scale != 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return blur_for_analysis(frame, scaled_kernel(scale))
+
+
+# Segmentación por teselas
+
+tile_pool: ThreadPoolExecutor = None
+
+
+def get_tile_pool():
+    global tile_pool
+    if tile_pool is None:
+        tile_pool = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tesela")
+    return tile_pool
+
+
+# máscara de fuego a escala de análisis calculada por teselas en paralelo. Cada tesela
+# se procesa con un margen igual al radio del desenfoque y solo se copia su parte
+# central, de modo que la máscara unida es idéntica a la de la imagen completa y las
+# regiones que cruzan los bordes de las teselas quedan unidas.
+def segment_tiled(frame, scale=None):
+    scale = ANALYSIS_SCALE if scale is None else scale
+    if scale != 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    kernel = scaled_kernel(scale)
+    halo = max(kernel) // 2
+    height, width = frame.shape[:2]
+    cols, rows = TILE_GRID
+    xs = np.linspace(0, width, cols + 1).astype(int)
+    ys = np.linspace(0, height, rows + 1).astype(int)
+    mask = np.empty((height, width), dtype=np.uint8)
+    get_fire_lut()
+
+    def segment_tile(x0, y0, x1, y1):
+        hx0, hy0 = max(x0 - halo, 0), max(y0 - halo, 0)
+        hx1, hy1 = min(x1 + halo, width), min(y1 + halo, height)
+        tile_mask = fire_mask(blur_for_analysis(frame[hy0:hy1, hx0:hx1], kernel))
+        mask[y0:y1, x0:x1] = tile_mask[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+
+    tiles = [(xs[c], ys[r], xs[c + 1], ys[r + 1]) for r in range(rows) for c in range(cols)]
+    for future in [get_tile_pool().submit(segment_tile, *tile) for tile in tiles]:
+        future.result()
+    return mask
+
+
+# máscara de fuego a escala de análisis calculada solo en las regiones indicadas (coordenadas
+# de frame). Como en segment_tiled, cada región se reduce, desenfoca y clasifica con un margen
+# igual al radio del desenfoque, así que el coste depende del área en movimiento y no de la
+# resolución; fuera de las regiones la máscara queda a cero.
+def segment_regions(frame, regions, scale=None):
+    scale = ANALYSIS_SCALE if scale is None else scale
+    frame_h, frame_w = frame.shape[:2]
+    # Mismo tamaño que daría cv2.resize(frame, None, fx=scale, fy=scale).
+    height, width = int(round(frame_h * scale)), int(round(frame_w * scale))
+    kernel = scaled_kernel(scale)
+    halo = max(kernel) // 2
+    mask = np.zeros((height, width), dtype=np.uint8)
+    get_fire_lut()
+
+    for (x, y, w, h) in regions:
+        x0, y0 = int(x * scale), int(y * scale)
+        x1 = min(int(np.ceil((x + w) * scale)), width)
+        y1 = min(int(np.ceil((y + h) * scale)), height)
+        hx0, hy0 = max(x0 - halo, 0), max(y0 - halo, 0)
+        hx1, hy1 = min(x1 + halo, width), min(y1 + halo, height)
+        if hx1 <= hx0 or hy1 <= hy0:
+            continue
+        roi = frame[int(hy0 / scale):min(int(np.ceil(hy1 / scale)), frame_h),
+                    int(hx0 / scale):min(int(np.ceil(hx1 / scale)), frame_w)]
+        if scale != 1.0:
+            roi = cv2.resize(roi, (hx1 - hx0, hy1 - hy0), interpolation=cv2.INTER_AREA)
+        region_mask = fire_mask(blur_for_analysis(roi, kernel))
+        mask[y0:y1, x0:x1] = region_mask[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+    return mask
 
 
 # Detección de fuego
 
-def detectar_fuego(hsv, frame):
-    mask1 = cv2.inRange(hsv, FIRE_LOWER1, FIRE_UPPER1)
-    mask2 = cv2.inRange(hsv, FIRE_LOWER2, FIRE_UPPER2)
-    mask3 = cv2.inRange(hsv, FIRE_LOWER3, FIRE_UPPER3)
-    mask = cv2.bitwise_or(mask1, mask2, mask3)
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    fire_detected = False
-    for contour in contours:
-        if cv2.contourArea(contour) > MIN_FIRE_AREA:
-            fire_detected = True
-            x, y, w, h = cv2.boundingRect(contour)
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.putText(frame, "fuego detectado", (x, y - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2, cv2.LINE_AA)
-    return fire_detected
+# máscara combinada de todos los rangos de fuego en una sola consulta a la LUT.
+def fire_mask(imagen):
+    lut = get_fire_lut()
+    return lut.mask_from_bgr(imagen) if FIRE_MASK_FROM_BGR else lut.mask_from_hsv(imagen)
+
+
+# Cada región de fuego se describe con área (px), caja (x, y, w, h), centroide (cx, cy)
+# y proporción de relleno de la caja, en coordenadas de frame.
+FIRE_BLOB_DTYPE = np.dtype([
+    ("area", np.float32), ("x", np.int32), ("y", np.int32), ("w", np.int32), ("h", np.int32),
+    ("cx", np.float32), ("cy", np.float32), ("fill", np.float32),
+])
+
+
+# extrae en una sola llamada las componentes conexas de mask mayores que min_area.
+def extract_blobs(mask, min_area, offset=(0, 0)):
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    # La etiqueta 0 es el fondo.
+    stats, centroids = stats[1:], centroids[1:]
+    keep = stats[:, cv2.CC_STAT_AREA] > min_area
+    stats, centroids = stats[keep], centroids[keep]
+
+    blobs = np.empty(len(stats), dtype=FIRE_BLOB_DTYPE)
+    blobs["area"] = stats[:, cv2.CC_STAT_AREA]
+    blobs["x"] = stats[:, cv2.CC_STAT_LEFT] + offset[0]
+    blobs["y"] = stats[:, cv2.CC_STAT_TOP] + offset[1]
+    blobs["w"] = stats[:, cv2.CC_STAT_WIDTH]
+    blobs["h"] = stats[:, cv2.CC_STAT_HEIGHT]
+    blobs["cx"] = centroids[:, 0] + offset[0]
+    blobs["cy"] = centroids[:, 1] + offset[1]
+    blobs["fill"] = blobs["area"] / (blobs["w"] * blobs["h"])
+    return blobs
+
+
+# pasa las regiones de coordenadas de imagen a coordenadas de frame.
+def scale_blobs(blobs, sx, sy):
+    if sx == 1.0 and sy == 1.0:
+        return blobs
+    scaled = blobs.copy()
+    scaled["x"] = blobs["x"] * sx
+    scaled["y"] = blobs["y"] * sy
+    scaled["w"] = np.ceil(blobs["w"] * sx)
+    scaled["h"] = np.ceil(blobs["h"] * sy)
+    scaled["cx"] = (blobs["cx"] + 0.5) * sx - 0.5
+    scaled["cy"] = (blobs["cy"] + 0.5) * sy - 0.5
+    scaled["area"] = blobs["area"] * (sx * sy)
+    return scaled
+
+
+# vuelve a segmentar a resolución completa la región de un candidato hallado a escala reducida.
+def refine_fire_blob(frame, blob, margin):
+    x, y, w, h = int(blob["x"]), int(blob["y"]), int(blob["w"]), int(blob["h"])
+    x0, y0 = max(x - margin, 0), max(y - margin, 0)
+    x1, y1 = min(x + w + margin, frame.shape[1]), min(y + h + margin, frame.shape[0])
+    roi = prepare_analysis(frame[y0:y1, x0:x1], 1.0)
+    return extract_blobs(fire_mask(roi), MIN_FIRE_AREA, offset=(x0, y0))
+
+
+# localiza las regiones de fuego en imagen y las devuelve (FIRE_BLOB_DTYPE) en coordenadas de frame.
+# imagen: salida de prepare_analysis (BGR difuminado o HSV según FIRE_MASK_FROM_BGR), a cualquier escala.
+def find_fire_blobs(imagen, frame):
+    return find_fire_blobs_in_mask(fire_mask(imagen), frame)
+
+
+# regiones de fuego (en coordenadas de frame) de una máscara a escala de análisis. Si se indican
+# regions (coordenadas de frame), las componentes se buscan solo en el rectángulo que las engloba.
+def find_fire_blobs_in_mask(mask, frame, regions=None):
+    sx = frame.shape[1] / mask.shape[1]
+    sy = frame.shape[0] / mask.shape[0]
+    min_area = MIN_FIRE_AREA / (sx * sy)
+    if regions is None:
+        return finish_blobs(extract_blobs(mask, min_area), frame, sx, sy)
+    if not regions:
+        return np.empty(0, dtype=FIRE_BLOB_DTYPE)
+    ux0 = int(min(x for x, _, _, _ in regions) / sx)
+    uy0 = int(min(y for _, y, _, _ in regions) / sy)
+    ux1 = int(np.ceil(max(x + w for x, _, w, _ in regions) / sx))
+    uy1 = int(np.ceil(max(y + h for _, y, _, h in regions) / sy))
+    blobs = extract_blobs(mask[uy0:uy1, ux0:ux1], min_area, offset=(ux0, uy0))
+    return finish_blobs(blobs, frame, sx, sy)
+
+
+# lleva las regiones a coordenadas de frame y, con COARSE_TO_FINE, las ajusta a resolución completa.
+def finish_blobs(blobs, frame, sx, sy):
+    blobs = scale_blobs(blobs, sx, sy)
+    if COARSE_TO_FINE and (sx > 1 or sy > 1) and len(blobs):
+        margin = GAUSSIAN_KERNEL[0] + int(np.ceil(max(sx, sy)))
+        blobs = np.concatenate([refine_fire_blob(frame, blob, margin) for blob in blobs])
+    return blobs
+
+
+# cajas (x, y, w, h) de las regiones, para quien no necesite el resto de estadísticas.
+def blob_boxes(blobs):
+    return [tuple(int(v) for v in box) for box in zip(blobs["x"], blobs["y"], blobs["w"], blobs["h"])]
+
+
+def draw_fire_blobs(frame, blobs):
+    for (x, y, w, h) in blob_boxes(blobs):
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(frame, "fuego detectado", (x, y - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2, cv2.LINE_AA)
+
+
+# analiza un fotograma preprocesado, dibuja y devuelve las regiones de fuego; con MOTION_GATE
+# solo se segmentan las zonas en movimiento y las regiones que no parpadean se descartan.
+def analyze_frame(frame):
+    if not MOTION_GATE:
+        if TILED_SEGMENTATION:
+            blobs = find_fire_blobs_in_mask(segment_tiled(frame), frame)
+        else:
+            blobs = find_fire_blobs(prepare_analysis(frame), frame)
+    else:
+        gate = get_motion_gate()
+        regions = gate.update(frame)
+        if regions:
+            blobs = find_fire_blobs_in_mask(segment_regions(frame, regions), frame, regions)
+        else:
+            # Un fotograma sin movimiento (llama pequeña o lejana, fotograma duplicado) se trata como
+            # uno omitido: se conservan las últimas regiones mientras su parpadeo siga activo.
+            blobs = gate.blobs
+        flicker = np.array([gate.flicker_ratio(box) for box in blob_boxes(blobs)])
+        blobs = blobs[flicker >= FLICKER_MIN_RATIO] if len(blobs) else blobs
+        gate.blobs = blobs
+    draw_fire_blobs(frame, blobs)
+    return blobs
+
+
+# Planificación
+
+class FrameScheduler:
+    """
+    Omite el análisis de algunos fotogramas cuando su coste medio supera CPU_BUDGET
+    del intervalo entre fotogramas de la cámara, para no acumular retraso.
+    """
+
+    def __init__(self, camera_fps=0.0):
+        fps = camera_fps if camera_fps and camera_fps > 0 else DEFAULT_CAMERA_FPS
+        self.intervalo = 1.0 / fps
+        self.costo = 0.0
+        self.paso = 1
+        self.pendientes = 0
+        self.saltados = 0
+
+    def should_analyze(self):
+        if not ADAPTIVE_SKIP or self.pendientes <= 0:
+            self.pendientes = self.paso - 1
+            return True
+        self.pendientes -= 1
+        self.saltados += 1
+        return False
+
+    def record(self, duracion):
+        """Actualiza el coste medio del análisis y el número de fotogramas por análisis."""
+        self.costo = duracion if self.costo == 0.0 else 0.8 * self.costo + 0.2 * duracion
+        paso = int(np.ceil(self.costo / (self.intervalo * CPU_BUDGET)))
+        self.paso = min(max(paso, 1), MAX_FRAME_SKIP + 1)
+
+
+# analiza el fotograma si el planificador lo permite; en caso contrario reutiliza
+# (y vuelve a dibujar) las regiones del último análisis.
+def analyze_scheduled(frame, planificador, blobs):
+    if not planificador.should_analyze():
+        draw_fire_blobs(frame, blobs)
+        return blobs
+    t_inicio = time.perf_counter()
+    blobs = analyze_frame(frame)
+    planificador.record(time.perf_counter() - t_inicio)
+    return blobs
 
 
 # Lógica de alarma
 
-def manejar_evento_alarma(fire_detected):
-    global estado_alarma, deteccion_continua, nivel_alarma
-
-    if fire_detected:
-        deteccion_continua += 1
-        if deteccion_continua >= ALARMA_THRESHOLD and nivel_alarma != "ALARM":
-            nivel_alarma = "ALARM"
-            if not alarma_hilo or not alarma_hilo.is_alive():
-                start_audio_thread()
-            print("Evento: Nivel de alarma Aumentado a ALARMA.")
-        elif deteccion_continua >= ALERTA_THRESHOLD and nivel_alarma == "OFF":
-            nivel_alarma = "ALERT"
-            if not alarma_hilo or not alarma_hilo.is_alive():
-                start_audio_thread()
-            print("Evento: Nivel de alarma Aumentado a ALERTA.")
+NIVELES_ALARMA: tuple = ("OFF", "ALERT", "ALARM")
+
+
+class AlarmState:
+    """Estado de la alerta escalonada de una cámara, independiente del audio."""
+
+    def __init__(self):
+        self.inicio_deteccion = None
+        self.nivel = "OFF"
+
+    def update(self, fire_detected, timestamp=None):
+        """
+        Actualiza el nivel con el resultado del fotograma capturado en timestamp
+        (time.perf_counter); devuelve el nuevo nivel o None si no cambió.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if fire_detected:
+            if self.inicio_deteccion is None:
+                self.inicio_deteccion = timestamp
+            sostenido = timestamp - self.inicio_deteccion
+            if sostenido >= ALARMA_SECONDS and self.nivel != "ALARM":
+                self.nivel = "ALARM"
+                return self.nivel
+            if sostenido >= ALERTA_SECONDS and self.nivel == "OFF":
+                self.nivel = "ALERT"
+                return self.nivel
+        else:
+            self.inicio_deteccion = None
+            if self.nivel != "OFF":
+                self.nivel = "OFF"
+                return self.nivel
+        return None
+
+
+estado_camara: AlarmState = AlarmState()
+
+
+# fija el nivel que reproduce el hilo de audio (único dueño de la alarma sonora).
+def set_alarm_level(nivel):
+    global nivel_alarma
+    nivel_alarma = nivel
+    if nivel != "OFF" and (not alarma_sonora or not alarma_sonora.is_alive()):
+        start_audio_thread()
+    if alarma_sonora:
+        alarma_sonora.set_level(nivel)
+    if nivel == "ALARM":
+        print("Evento: Nivel de alarma Aumentado a ALARMA.")
+    elif nivel == "ALERT":
+        print("Evento: Nivel de alarma Aumentado a ALERTA.")
     else:
-        deteccion_continua = 0
-        if nivel_alarma != "OFF":
-            nivel_alarma = "OFF"
-            print("Evento: Nivel de alarma restablecido a OFF.")
+        print("Evento: Nivel de alarma restablecido a OFF.")
 
 
-# Bucle principal
+def manejar_evento_alarma(fire_detected, timestamp=None):
+    nuevo_nivel = estado_camara.update(fire_detected, timestamp)
+    if nuevo_nivel is not None:
+        set_alarm_level(nuevo_nivel)
+        if grabador is not None and nuevo_nivel != "OFF":
+            grabador.trigger(nuevo_nivel)
 
-def main():
-    video = cv2.VideoCapture(0)
-    if not video.isOpened():
-        print("Error: No se pudo abrir la cámara.")
+
+# Grabación de evidencias
+
+class ClipRecorder:
+    """
+    Búfer circular preasignado con los últimos PRE_EVENT_SECONDS de fotogramas.
+    Cada escalada encola un clip que un hilo escritor guarda copiando cada ranura del
+    búfer; el bucle de detección solo escribe su fotograma en la ranura siguiente.
+    """
+
+    def __init__(self, frame_shape, prefijo="fuego"):
+        height, width = frame_shape[:2]
+        self.size = (max(1, int(width * CLIP_SCALE)), max(1, int(height * CLIP_SCALE)))
+        self.capacity = max(1, int(PRE_EVENT_SECONDS * CLIP_FPS))
+        self.post_frames = int(POST_EVENT_SECONDS * CLIP_FPS)
+        self.prefijo = prefijo
+        self.frames = np.zeros((self.capacity, self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.seqs = np.full(self.capacity, -1, dtype=np.int64)
+        self.head = 0
+        self._intervalo = 1.0 / CLIP_FPS
+        self._ultimo = 0.0
+        self._cond = threading.Condition()
+        self._eventos = queue.Queue(maxsize=4)
+        self._activo = True
+        self._hilo = threading.Thread(target=self._run, daemon=True)
+        self._hilo.start()
+
+    def push(self, frame):
+        """Guarda el fotograma (reducido a CLIP_SCALE) en la ranura siguiente a CLIP_FPS."""
+        ahora = time.perf_counter()
+        if ahora - self._ultimo < self._intervalo:
+            return
+        self._ultimo = ahora
+        slot = self.head % self.capacity
+        self.seqs[slot] = -1
+        cv2.resize(frame, self.size, dst=self.frames[slot], interpolation=cv2.INTER_AREA)
+        self.seqs[slot] = self.head
+        with self._cond:
+            self.head += 1
+            self._cond.notify_all()
+
+    def trigger(self, nivel):
+        """Solicita un clip sin bloquear; si el escritor va retrasado, el evento se descarta."""
+        marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+        try:
+            self._eventos.put_nowait((nivel, self.head, marca))
+        except queue.Full:
+            print(f"Aviso: Clip {nivel} descartado, el escritor está ocupado.")
+
+    def stop(self):
+        self._activo = False
+        with self._cond:
+            self._cond.notify_all()
+        self._hilo.join(timeout=2.0)
+
+    def _run(self):
+        while self._activo:
+            try:
+                nivel, seq_evento, marca = self._eventos.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._write_clip(nivel, seq_evento, marca)
+            except Exception as e:
+                print(f"Error guardando el clip: {e}")
+
+    def _write_clip(self, nivel, seq_evento, marca):
+        os.makedirs(CLIP_DIR, exist_ok=True)
+        ruta = os.path.join(CLIP_DIR, f"{self.prefijo}_{nivel}_{marca}.avi")
+        writer = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*"MJPG"), CLIP_FPS, self.size)
+        seq = max(seq_evento - self.capacity, 0)
+        fin = seq_evento + self.post_frames
+        escritos = 0
+        copia = np.empty_like(self.frames[0])
+        try:
+            while seq < fin and self._activo:
+                with self._cond:
+                    # Si el flujo se detiene se cierra el clip con lo disponible.
+                    if seq >= self.head and not self._cond.wait_for(
+                            lambda: seq < self.head or not self._activo, timeout=2.0):
+                        break
+                slot = seq % self.capacity
+                # Bloqueo por secuencia: la ranura se copia y solo se escribe si su número de
+                # secuencia no cambió durante la copia (push la marca con -1 mientras la reescribe).
+                # Una ranura ya reutilizada por un fotograma posterior se omite.
+                if self.seqs[slot] == seq:
+                    np.copyto(copia, self.frames[slot])
+                    if self.seqs[slot] == seq:
+                        writer.write(copia)
+                        escritos += 1
+                seq += 1
+        finally:
+            writer.release()
+        print(f"Evento: Clip {nivel} guardado en {ruta} ({escritos} fotogramas).")
+
+
+grabador: ClipRecorder = None
+
+
+# añade el fotograma procesado al búfer de evidencias (si la grabación está activa).
+def record_frame(frame):
+    global grabador
+    if not CLIP_RECORDING:
         return
+    if grabador is None:
+        grabador = ClipRecorder(frame.shape)
+    grabador.push(frame)
 
-    try:
+
+# Pipeline por etapas
+
+class LatestFrameQueue:
+    """Cola acotada que descarta los elementos obsoletos y conserva solo los más recientes."""
+
+    def __init__(self, maxsize=1):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, item):
         while True:
-            ret, frame = video.read()
-            if not ret:
-                print("Error: No se pudo leer el fotograma.")
-                break
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self._queue.get(timeout=timeout)
+
+
+class LatencyStats:
+    """Acumula la latencia media y máxima de cada etapa del pipeline."""
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            total, count, worst = self._stages.get(stage, (0.0, 0, 0.0))
+            self._stages[stage] = (total + seconds, count + 1, max(worst, seconds))
+
+    def report(self, reset=True):
+        with self._lock:
+            lines = [f"  {stage}: media {total / count * 1000:.1f} ms, máx {worst * 1000:.1f} ms ({count})"
+                     for stage, (total, count, worst) in self._stages.items()]
+            if reset:
+                self._stages = {}
+        return "\n".join(lines)
+
+
+# lee fotogramas sin esperar al análisis; si éste va lento, los fotogramas viejos se descartan.
+def capture_stage(video, salida, detener):
+    while not detener.is_set():
+        ret, frame = video.read()
+        if not ret:
+            print("Error: No se pudo leer el fotograma.")
+            detener.set()
+            break
+        salida.put((time.perf_counter(), frame))
+
+
+# analiza siempre el último fotograma capturado y actualiza el nivel de alarma.
+def analysis_stage(entrada, salida, stats, detener):
+    try:
+        while not detener.is_set():
+            try:
+                t_captura, frame = entrada.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            t_inicio = time.perf_counter()
             frame = preprocess_frame(frame)
-            hsv = apply_blur_and_hsv(frame)
+            blobs = analyze_frame(frame)
+            record_frame(frame)
+            manejar_evento_alarma(len(blobs) > 0, t_captura)
+            t_alarma = time.perf_counter()
 
-            fire_detected = detectar_fuego(hsv, frame)
-            manejar_evento_alarma(fire_detected)
+            stats.record("espera captura", t_inicio - t_captura)
+            stats.record("análisis", t_alarma - t_inicio)
+            stats.record("lente -> alarma", t_alarma - t_captura)
+            salida.put((t_captura, frame))
+    except Exception as e:
+        print(f"Error en la etapa de análisis: {e}")
+        detener.set()
+
+
+# ejecuta captura y análisis en hilos; la visualización queda en el hilo principal (requisito de HighGUI).
+def run_pipeline(video):
+    video.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    capturas = LatestFrameQueue()
+    resultados = LatestFrameQueue()
+    stats = LatencyStats()
+    detener = threading.Event()
 
-            cv2.imshow(TITLE_FRAME, frame)
+    hilos = [
+        threading.Thread(target=capture_stage, args=(video, capturas, detener), daemon=True),
+        threading.Thread(target=analysis_stage, args=(capturas, resultados, stats, detener), daemon=True),
+    ]
+    for hilo in hilos:
+        hilo.start()
+
+    mostrado = False
+    ultimo_reporte = time.perf_counter()
+    try:
+        while not detener.is_set():
+            try:
+                t_captura, frame = resultados.get(timeout=0.05)
+                cv2.imshow(TITLE_FRAME, frame)
+                mostrado = True
+                stats.record("lente -> pantalla", time.perf_counter() - t_captura)
+            except queue.Empty:
+                pass
 
             key = cv2.waitKey(1)
             if key == 27:
                 break
-            if cv2.getWindowProperty(TITLE_FRAME, cv2.WND_PROP_VISIBLE) < 1:
+            if mostrado and cv2.getWindowProperty(TITLE_FRAME, cv2.WND_PROP_VISIBLE) < 1:
+                break
+
+            if time.perf_counter() - ultimo_reporte >= LATENCY_REPORT_INTERVAL:
+                ultimo_reporte = time.perf_counter()
+                print(f"Latencias (descartados: captura {capturas.dropped}, "
+                      f"pantalla {resultados.dropped}):\n{stats.report()}")
+    finally:
+        detener.set()
+        for hilo in hilos:
+            hilo.join(timeout=1.0)
+
+
+# Monitoreo de varias cámaras
+
+stream_eventos = None
+stream_detener = None
+
+
+def init_stream_worker(eventos, detener):
+    global stream_eventos, stream_detener
+    stream_eventos = eventos
+    stream_detener = detener
+    # Un hilo de OpenCV por proceso: el paralelismo lo dan los procesos.
+    cv2.setNumThreads(1)
+
+
+# analiza un flujo en un proceso del pool con su propio estado y envía al agregador
+# los cambios de nivel y los fps medidos.
+def stream_worker(stream_id, source):
+    video = cv2.VideoCapture(source)
+    if not video.isOpened():
+        stream_eventos.put(("fin", stream_id, "no se pudo abrir la fuente"))
+        return
+
+    get_fire_lut()
+    estado = AlarmState()
+    planificador = FrameScheduler(video.get(cv2.CAP_PROP_FPS))
+    blobs = np.empty(0, dtype=FIRE_BLOB_DTYPE)
+    grabador_flujo = None
+    fotogramas = 0
+    inicio = time.perf_counter()
+    motivo = "detenido"
+    try:
+        while not stream_detener.is_set():
+            ret, frame = video.read()
+            if not ret:
+                motivo = "fin del flujo"
                 break
+            t_captura = time.perf_counter()
+
+            frame = preprocess_frame(frame)
+            blobs = analyze_scheduled(frame, planificador, blobs)
+            if CLIP_RECORDING:
+                if grabador_flujo is None:
+                    grabador_flujo = ClipRecorder(frame.shape, f"camara{stream_id}")
+                grabador_flujo.push(frame)
+
+            nuevo_nivel = estado.update(len(blobs) > 0, t_captura)
+            if nuevo_nivel is not None:
+                stream_eventos.put(("nivel", stream_id, nuevo_nivel))
+                if grabador_flujo is not None and nuevo_nivel != "OFF":
+                    grabador_flujo.trigger(nuevo_nivel)
+
+            fotogramas += 1
+            transcurrido = time.perf_counter() - inicio
+            if transcurrido >= 1.0:
+                stream_eventos.put(("fps", stream_id, fotogramas / transcurrido))
+                fotogramas = 0
+                inicio = time.perf_counter()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        motivo = f"error: {e}"
+    finally:
+        video.release()
+        if grabador_flujo is not None:
+            grabador_flujo.stop()
+        stream_eventos.put(("fin", stream_id, motivo))
+
+
+# convierte "0", "1"... en índices de cámara y deja el resto como rutas o URLs.
+def parse_source(source):
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+
+# lanza un proceso por flujo y agrega sus eventos: el nivel sonoro es el máximo de todos los flujos.
+def run_multi_stream(sources):
+    ctx = multiprocessing.get_context("spawn")
+    eventos = ctx.Queue()
+    detener = ctx.Event()
+    niveles = {i: "OFF" for i in range(len(sources))}
+    fps = {i: 0.0 for i in range(len(sources))}
+    activos = set(niveles)
+    finalizados = set()
+    ultimo_evento = {i: time.perf_counter() for i in niveles}
+
+    with ctx.Pool(processes=len(sources), initializer=init_stream_worker,
+                  initargs=(eventos, detener)) as pool:
+        for i, source in enumerate(sources):
+            # Si el proceso lanza una excepción fuera de su try, el flujo se da por finalizado igualmente.
+            pool.apply_async(stream_worker, (i, source),
+                             error_callback=lambda e, i=i: eventos.put(("fin", i, f"error: {e}")))
+
+        ultimo_reporte = time.perf_counter()
+        try:
+            while activos:
+                try:
+                    tipo, stream_id, valor = eventos.get(timeout=0.5)
+                except queue.Empty:
+                    tipo = None
+
+                if tipo in ("nivel", "fps"):
+                    # Un flujo dado por perdido que vuelve a enviar eventos se reactiva.
+                    activos.add(stream_id)
+                    ultimo_evento[stream_id] = time.perf_counter()
+                if tipo == "nivel":
+                    niveles[stream_id] = valor
+                    print(f"Evento: Cámara {stream_id} ({sources[stream_id]}) en nivel {valor}.")
+                elif tipo == "fps":
+                    fps[stream_id] = valor
+                elif tipo == "fin":
+                    activos.discard(stream_id)
+                    finalizados.add(stream_id)
+                    niveles[stream_id] = "OFF"
+                    fps[stream_id] = 0.0
+                    print(f"Evento: Cámara {stream_id} ({sources[stream_id]}) finalizada: {valor}.")
+
+                # Un flujo sin eventos no debe dejar su último nivel (quizá ALARM) enganchado.
+                for i in [i for i in activos if time.perf_counter() - ultimo_evento[i] > STREAM_STALL_SECONDS]:
+                    activos.discard(i)
+                    niveles[i] = "OFF"
+                    fps[i] = 0.0
+                    print(f"Evento: Cámara {i} ({sources[i]}) sin respuesta durante "
+                          f"{STREAM_STALL_SECONDS:.0f} s, se da por finalizada.")
+
+                global_nivel = max(niveles.values(), key=NIVELES_ALARMA.index)
+                if global_nivel != nivel_alarma:
+                    set_alarm_level(global_nivel)
+
+                if time.perf_counter() - ultimo_reporte >= STREAM_REPORT_INTERVAL:
+                    ultimo_reporte = time.perf_counter()
+                    print("\n".join(f"  Cámara {i} ({sources[i]}): {fps[i]:.1f} fps, nivel {niveles[i]}"
+                                    for i in range(len(sources))))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            detener.set()
+            # Se vacía la cola para que ningún proceso quede bloqueado al terminar.
+            limite = time.perf_counter() + 5.0
+            while len(finalizados) < len(sources) and time.perf_counter() < limite:
+                try:
+                    tipo, stream_id, _ = eventos.get(timeout=0.5)
+                    if tipo == "fin":
+                        finalizados.add(stream_id)
+                except queue.Empty:
+                    pass
+            if len(finalizados) < len(sources):
+                # Algún proceso no respondió (colgado o muerto): no se espera por él.
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+
+# Bucle principal
+
+# ejecuta captura, análisis y visualización uno tras otro en el mismo hilo.
+def run_sequential(video):
+    planificador = FrameScheduler(video.get(cv2.CAP_PROP_FPS))
+    blobs = np.empty(0, dtype=FIRE_BLOB_DTYPE)
+    while True:
+        ret, frame = video.read()
+        if not ret:
+            print("Error: No se pudo leer el fotograma.")
+            break
+        t_captura = time.perf_counter()
+
+        frame = preprocess_frame(frame)
+
+        blobs = analyze_scheduled(frame, planificador, blobs)
+        record_frame(frame)
+        manejar_evento_alarma(len(blobs) > 0, t_captura)
+
+        cv2.imshow(TITLE_FRAME, frame)
+
+        key = cv2.waitKey(1)
+        if key == 27:
+            break
+        if cv2.getWindowProperty(TITLE_FRAME, cv2.WND_PROP_VISIBLE) < 1:
+            break
+
+
+def main():
+    sources = [parse_source(s) for s in (sys.argv[1:] or VIDEO_SOURCES)]
+    # Los sonidos se decodifican antes de abrir las cámaras para que la primera
+    # escalada suene sin demora.
+    start_audio_thread()
+    if len(sources) > 1:
+        try:
+            run_multi_stream(sources)
+        finally:
+            print("Finalizando aplicación...")
+            stop_audio_thread()
+        return
+
+    video = cv2.VideoCapture(sources[0])
+    if not video.isOpened():
+        print("Error: No se pudo abrir la cámara.")
+        stop_audio_thread()
+        return
+
+    get_fire_lut()
+
+    try:
+        if PIPELINE_MODE:
+            run_pipeline(video)
+        else:
+            run_sequential(video)
     except Exception as e:
         print(f"Ocurrió un error inesperado: {e}")
     finally:
         print("Finalizando aplicación...")
         video.release()
         cv2.destroyAllWindows()
+        if grabador is not None:
+            grabador.stop()
         stop_audio_thread()
         sys.exit()
 
@@ -0,0 +1,234 @@
+# Motor de alarma sonora multiplataforma: un único hilo reproductor con tonos pre-sintetizados
+
+import io
+import time
+import queue
+import wave
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+FADE_MS = 5
+
+
+def synthesize_tone(frequency: float, duration_ms: int, sample_rate: int = SAMPLE_RATE,
+                    volume: float = 0.5) -> np.ndarray:
+    """
+    Sintetiza un tono senoidal en int16
+    Args:
+        frequency (float): Frecuencia en Hz
+        duration_ms (int): Duración en milisegundos
+        sample_rate (int): Frecuencia de muestreo
+        volume (float): Amplitud relativa (0..1)
+    Returns:
+        np.ndarray: Muestras mono int16
+    """
+    n = int(sample_rate * duration_ms / 1000)
+    t = np.arange(n, dtype=np.float32) / sample_rate
+    tone = np.sin(2 * np.pi * frequency * t) * volume
+
+    # Rampa corta al inicio y al final para evitar chasquidos
+    fade = min(int(sample_rate * FADE_MS / 1000), n // 2)
+    if fade > 0:
+        ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+        tone[:fade] *= ramp
+        tone[-fade:] *= ramp[::-1]
+    return (tone * 32767).astype(np.int16)
+
+
+class AudioBackend:
+    """
+    Interfaz común: play() reproduce un búfer int16 mono, bloquea hasta entregarlo al dispositivo
+    y devuelve el instante (time.perf_counter) en que empieza a sonar.
+    """
+
+    name = "base"
+
+    def prepare(self, samples: np.ndarray, sample_rate: int):
+        """Convierte el búfer al formato del backend (se llama una vez por tono)"""
+        return samples
+
+    def play(self, prepared) -> float:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SoundDeviceBackend(AudioBackend):
+    """
+    Reproduce con sounddevice (PortAudio): Linux, Windows y macOS.
+    Abre un único stream de salida al crearse y escribe en él los tonos preparados, en lugar de
+    abrir un stream de PortAudio por pitido como sd.play(); mientras no hay pitidos suena silencio.
+    """
+
+    name = "sounddevice"
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        import sounddevice
+        try:
+            self.stream = sounddevice.OutputStream(samplerate=sample_rate, channels=1, dtype='int16')
+            self.stream.start()
+        except sounddevice.PortAudioError as e:
+            raise OSError(f"No se pudo abrir la salida de audio: {e}") from e
+        self.sample_rate = sample_rate
+        # Instante en que termina de sonar lo ya escrito en el stream
+        self.busy_until = 0.0
+
+    def play(self, prepared) -> float:
+        # El primer sample llega a la salida tras la latencia del stream, o cuando acaba el pitido anterior
+        started = max(time.perf_counter() + self.stream.latency, self.busy_until)
+        self.busy_until = started + len(prepared) / self.sample_rate
+        self.stream.write(prepared)
+        return started
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+
+class WinsoundBackend(AudioBackend):
+    """Reproduce un WAV en memoria con winsound (solo Windows, sin dependencias)."""
+
+    name = "winsound"
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        import winsound
+        self.winsound = winsound
+
+    def prepare(self, samples, sample_rate):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(samples.tobytes())
+        return buffer.getvalue()
+
+    def play(self, prepared) -> float:
+        # PlaySound no informa de cuándo empieza a sonar: se toma el instante de la llamada
+        started = time.perf_counter()
+        self.winsound.PlaySound(prepared, self.winsound.SND_MEMORY)
+        return started
+
+
+class NullBackend(AudioBackend):
+    """Backend silencioso para pruebas o equipos sin audio: solo cuenta los pitidos."""
+
+    name = "null"
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.played = 0
+
+    def play(self, prepared) -> float:
+        self.played += 1
+        return time.perf_counter()
+
+
+AUDIO_BACKENDS = {
+    SoundDeviceBackend.name: SoundDeviceBackend,
+    WinsoundBackend.name: WinsoundBackend,
+    NullBackend.name: NullBackend,
+}
+
+
+def create_audio_backend(name: str = "auto", sample_rate: int = SAMPLE_RATE) -> AudioBackend:
+    """
+    Crea el backend de audio por nombre
+    Con "auto" prueba sounddevice, luego winsound y, si ninguno está disponible, el silencioso.
+    """
+    if name != "auto":
+        try:
+            backend_class = AUDIO_BACKENDS[name]
+        except KeyError:
+            raise ValueError(f"Backend de audio desconocido '{name}'. Opciones: auto, {', '.join(AUDIO_BACKENDS)}")
+        return backend_class(sample_rate)
+
+    for backend_class in (SoundDeviceBackend, WinsoundBackend):
+        try:
+            return backend_class(sample_rate)
+        except (ImportError, OSError):
+            continue
+    logging.warning("No hay backend de audio disponible; las alarmas sonoras serán silenciosas.")
+    return NullBackend(sample_rate)
+
+
+class AlarmSoundEngine:
+    def __init__(self, tones: list, backend: str = "auto", sample_rate: int = SAMPLE_RATE,
+                 max_queue: int = 4):
+        """
+        Reproductor de alarmas con un único hilo persistente y cola de órdenes
+        Args:
+            tones (list): Pares (frecuencia Hz, duración ms) que se sintetizan al arrancar
+            backend (str): "auto", "sounddevice", "winsound" o "null"
+            sample_rate (int): Frecuencia de muestreo de los tonos
+            max_queue (int): Pitidos pendientes como máximo; si se llena se descartan los nuevos
+        """
+        self.sample_rate = sample_rate
+        self.backend = create_audio_backend(backend, sample_rate)
+        self.tones = {}
+        for frequency, duration_ms in tones:
+            self._tone(frequency, duration_ms)
+
+        # Latencia desde que se pide el pitido hasta que empieza a sonar, según el backend (últimos pitidos)
+        self.latencies = deque(maxlen=1000)
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def _tone(self, frequency: int, duration_ms: int):
+        key = (frequency, duration_ms)
+        prepared = self.tones.get(key)
+        if prepared is None:
+            samples = synthesize_tone(frequency, duration_ms, self.sample_rate)
+            prepared = self.backend.prepare(samples, self.sample_rate)
+            self.tones[key] = prepared
+        return prepared
+
+    def play(self, frequency: int, duration_ms: int) -> bool:
+        """Encola un pitido sin bloquear. Devuelve False si la cola estaba llena."""
+        try:
+            self.queue.put_nowait((frequency, duration_ms, time.perf_counter()))
+            return True
+        except queue.Full:
+            logging.warning(f"Cola de audio llena, pitido de {frequency}Hz descartado.")
+            return False
+
+    def stop(self, timeout: float = 1.0):
+        """Detiene el hilo reproductor tras los pitidos pendientes y libera el backend"""
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._worker.join(timeout)
+        self.backend.close()
+
+    def latency_stats(self) -> dict:
+        """Media y p95 en milisegundos de la latencia de los pitidos reproducidos"""
+        if not self.latencies:
+            return {'pitidos': 0, 'media_ms': 0.0, 'p95_ms': 0.0}
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'pitidos': len(latencies),
+            'media_ms': float(latencies.mean()),
+            'p95_ms': float(np.percentile(latencies, 95)),
+        }
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            frequency, duration_ms, requested = item
+            prepared = self._tone(frequency, duration_ms)
+            try:
+                started = self.backend.play(prepared)
+            except Exception as e:
+                logging.error(f"Error al reproducir el pitido de {frequency}Hz: {e}")
+                continue
+            self.latencies.append(started - requested)
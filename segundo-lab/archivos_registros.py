@@ -0,0 +1,51 @@
+# Archivos binarios de registros de tamaño fijo (cabecera común y lectura mapeada en memoria)
+# y escritura atómica de los índices JSON que los acompañan
+
+import os
+import json
+
+import numpy as np
+
+# Cabecera: firma de 4 bytes, versión y tamaño de registro (uint32), rellenada hasta 16 bytes
+HEADER_SIZE = 16
+
+
+def write_json(path: str, data, **options):
+    """Escribe un JSON de forma atómica: primero en un temporal que luego sustituye al archivo"""
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **options)
+    os.replace(tmp, path)
+
+
+def record_header(magic: bytes, version: int, dtype: np.dtype) -> bytes:
+    """Cabecera de un archivo de registros con la firma, la versión y el tamaño de registro de dtype"""
+    header = magic + np.array([version, dtype.itemsize], dtype='<u4').tobytes()
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def load_records(path: str, magic: bytes, version: int, dtype: np.dtype, description: str) -> np.ndarray:
+    """
+    Abre un archivo de registros como array mapeado en memoria (sin copiarlo a RAM).
+    Un registro final incompleto (escritura interrumpida) se ignora.
+    Args:
+        path (str): Ruta del archivo
+        magic (bytes): Firma esperada
+        version (int): Versión esperada
+        dtype (np.dtype): Tipo de los registros
+        description (str): Qué contiene el archivo, para los mensajes de error ("una sesión de landmarks")
+    Returns:
+        np.ndarray: Registros con el dtype indicado
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:4] != magic:
+        raise ValueError(f"{path} no es {description}")
+    file_version, itemsize = np.frombuffer(header[4:12], dtype='<u4')
+    if file_version != version or itemsize != dtype.itemsize:
+        raise ValueError(f"Versión no soportada en {path}: {file_version}")
+
+    rows = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if rows == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(rows,))
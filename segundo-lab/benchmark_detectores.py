@@ -0,0 +1,130 @@
+# Comparación de detectores de rostros sobre una carpeta de clips grabados
+
+import os
+import csv
+import time
+import argparse
+
+import cv2
+import imutils
+import numpy as np
+
+from detectores_rostro import FACE_DETECTORS, create_face_detector
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov')
+
+
+def iter_frames(folder, width=640):
+    """Recorre las imágenes y los videos de la carpeta en orden y devuelve (nombre, frame)"""
+    for filename in sorted(os.listdir(folder)):
+        path = os.path.join(folder, filename)
+        lower = filename.lower()
+        if lower.endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield filename, imutils.resize(frame, width=width)
+        elif lower.endswith(VIDEO_EXTENSIONS):
+            cap = cv2.VideoCapture(path)
+            index = 0
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield f"{filename}#{index}", imutils.resize(frame, width=width)
+                index += 1
+            cap.release()
+
+
+def load_annotations(path):
+    """
+    Lee un CSV con columnas nombre,x,y,w,h (coordenadas a la anchura de análisis).
+    El nombre es el del archivo de imagen o "video.mp4#indice" para frames de video.
+    """
+    annotations = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row or row[0] == 'nombre':
+                continue
+            annotations.setdefault(row[0], []).append(tuple(int(v) for v in row[1:5]))
+    return annotations
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def benchmark(detector, frames, annotations=None, iou_threshold=0.5):
+    """
+    Mide latencia, throughput y recall de un detector sobre un iterable de (nombre, frame)
+    Sin anotaciones se asume un rostro por frame (cámara de cabina) y el recall es
+    la fracción de frames con al menos una detección.
+    """
+    latencies = []
+    hits = 0
+    expected = 0
+    for name, frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        start = time.perf_counter()
+        boxes = detector.detect(frame, gray)
+        latencies.append(time.perf_counter() - start)
+
+        if annotations is None:
+            expected += 1
+            hits += 1 if boxes else 0
+        else:
+            for truth in annotations.get(name, []):
+                expected += 1
+                if any(iou(truth, box) >= iou_threshold for box in boxes):
+                    hits += 1
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'frames': len(latencies),
+        'media_ms': latencies.mean(),
+        'p95_ms': np.percentile(latencies, 95),
+        'fps': 1000.0 / latencies.mean(),
+        'recall': hits / expected if expected else float('nan'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara los detectores de rostros disponibles")
+    parser.add_argument('carpeta', help="Carpeta con imágenes o videos grabados")
+    parser.add_argument('--detectores', nargs='+', default=list(FACE_DETECTORS),
+                        help="Detectores a comparar (por defecto todos)")
+    parser.add_argument('--anotaciones', help="CSV nombre,x,y,w,h con los rostros reales")
+    parser.add_argument('--ancho', type=int, default=640, help="Anchura de análisis (como en la detección en vivo)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.carpeta):
+        print(f"Error: {args.carpeta} no es una carpeta")
+        return
+
+    # Los frames se leen de disco en streaming para cada detector (un clip de varios minutos no cabe
+    # en memoria); benchmark() solo cronometra detect(), así que la decodificación no se mide
+    if next(iter_frames(args.carpeta, args.ancho), None) is None:
+        print(f"No se encontraron imágenes ni videos en {args.carpeta}")
+        return
+    annotations = load_annotations(args.anotaciones) if args.anotaciones else None
+
+    print(f"{'detector':<8} {'frames':>7} {'media ms':>9} {'p95 ms':>8} {'fps':>7} {'recall':>7}")
+    for name in args.detectores:
+        try:
+            detector = create_face_detector(name)
+        except (ValueError, FileNotFoundError) as e:
+            print(f"{name:<8} omitido: {e}")
+            continue
+        r = benchmark(detector, iter_frames(args.carpeta, args.ancho), annotations)
+        print(f"{name:<8} {r['frames']:>7} {r['media_ms']:>9.1f} {r['p95_ms']:>8.1f} "
+              f"{r['fps']:>7.1f} {r['recall']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,33 +2,142 @@
 
 import cv2
 import os
+import time
+import queue
 import imutils
+import threading
+import numpy as np
+from collections import deque
 from datetime import datetime
 
+from dataset_rostros import FACE_SIZE, PackedFaceDataset
+from detectores_rostro import create_face_detector
+
 def create_directory(path):
     """Crea un directorio si no existe"""
     if not os.path.exists(path):
         os.makedirs(path)
         print(f'Carpeta creada: {path}')
 
-def capture_faces(person_name, max_images=300, min_confidence=1.3):
-    """Función principal para capturar rostros"""
+def difference_hash(gray_face, hash_size=8):
+    """Hash perceptual (dHash) de 64 bits: compara cada píxel con su vecino en una miniatura 9x8"""
+    small = cv2.resize(gray_face, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def is_near_duplicate(face_hash, recent_hashes, max_distance):
+    """True si el hash está a max_distance bits o menos de alguno de los rostros guardados recientemente"""
+    return any(bin(face_hash ^ h).count('1') <= max_distance for h in recent_hashes)
+
+class FaceWriter:
+    """
+    Guarda los rostros en hilos aparte; si la cola está llena el rostro se descarta.
+    `write` recibe los argumentos de submit() y devuelve True si se guardó (por defecto cv2.imwrite).
+    """
+
+    def __init__(self, workers=2, max_queue=32, write=cv2.imwrite):
+        self.write = write
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.saved = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, *args):
+        """Encola una imagen sin bloquear. Devuelve False si la cola estaba llena."""
+        try:
+            self.queue.put_nowait(args)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        """Espera a que se escriban las imágenes pendientes"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                ok = self.write(*item)
+            except OSError:
+                ok = False
+            with self.lock:
+                if ok:
+                    self.saved += 1
+                else:
+                    self.failed += 1
+
+def search_window(boxes, padding, width, height):
+    """Ventana (x0, y0, x1, y1) que cubre las cajas ampliadas en `padding` veces su tamaño"""
+    x0 = min(x for x, y, w, h in boxes)
+    y0 = min(y for x, y, w, h in boxes)
+    x1 = max(x + w for x, y, w, h in boxes)
+    y1 = max(y + h for x, y, w, h in boxes)
+    pad = int(padding * max(x1 - x0, y1 - y0))
+    return max(x0 - pad, 0), max(y0 - pad, 0), min(x1 + pad, width), min(y1 + pad, height)
+
+def detect_faces(face_detector, frame, gray, window=None):
+    """Detecta rostros en todo el frame o solo dentro de la ventana, con cajas en coordenadas del frame"""
+    if window is None:
+        return face_detector.detect(frame, gray)
+    x0, y0, x1, y1 = window
+    faces = face_detector.detect(frame[y0:y1, x0:x1], gray[y0:y1, x0:x1])
+    return [(x + x0, y + y0, w, h) for (x, y, w, h) in faces]
+
+def capture_faces(person_name, max_images=300, min_confidence=1.3, detector="haar",
+                  min_hash_distance=6, recent_hashes=64, writers=2,
+                  roi_search=True, roi_padding=0.5, full_scan_interval=15, packed_path=None):
+    """
+    Función principal para capturar rostros (detector: "haar", "hog" o "dnn").
+    Los rostros casi idénticos a uno reciente (dHash a min_hash_distance bits o menos de
+    los últimos recent_hashes guardados; 0 desactiva el filtro) se omiten, y las imágenes
+    se escriben en segundo plano con `writers` hilos.
+    Con roi_search el detector solo busca en una ventana alrededor del último rostro
+    (ampliada roi_padding veces su tamaño) y recorre el frame completo cuando lo pierde
+    o cada full_scan_interval frames.
+    Con packed_path los rostros se añaden en escala de grises al dataset empaquetado
+    (dataset_rostros.py) de esa carpeta en lugar de guardarse como JPEG.
+    """
     # Configuración de rutas
     base_dir = os.path.dirname(os.path.abspath(__file__))
     data_path = os.path.join(base_dir, 'captura') 
     person_path = os.path.join(data_path, person_name)
-    create_directory(person_path)
+    if packed_path is None:
+        create_directory(person_path)
 
-    # Inicialización de la cámara y el clasificador
+    # Inicialización de la cámara y el detector de rostros
     cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-    face_classifier = cv2.CascadeClassifier(cv2.data.haarcascades +
-        'haarcascade_frontalface_default.xml')
+    # min_confidence es el scaleFactor de la cascada de Haar
+    options = {'scale_factor': min_confidence} if detector == 'haar' else {}
+    face_detector = create_face_detector(detector, **options)
 
     if not cap.isOpened():
         print("Error: No se pudo acceder a la cámara")
         return
 
+    # Un único sello de tiempo por sesión; el contador ya hace únicos los nombres
+    session = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if packed_path is not None:
+        dataset = PackedFaceDataset(packed_path)
+        label = dataset.label_for(person_name)
+        writer = FaceWriter(workers=1, write=lambda face: dataset.append(face, label))
+    else:
+        dataset = None
+        writer = FaceWriter(workers=writers)
+    kept_hashes = deque(maxlen=recent_hashes)
+    duplicates = 0
     count = 0
+    last_faces = []
+    frames_since_full = 0
+    timings = {'roi': [], 'completo': []}
     try:
         while True:
             ret, frame = cap.read()
@@ -40,12 +149,24 @@ def capture_faces(person_name, max_images=300, min_confidence=1.3):
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             aux_frame = frame.copy()
 
-            faces = face_classifier.detectMultiScale(
-                gray,
-                scaleFactor=min_confidence,
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
+            # Búsqueda en la ventana del último rostro; frame completo si se pierde o toca refrescar
+            start = time.perf_counter()
+            faces = []
+            use_roi = roi_search and last_faces and frames_since_full < full_scan_interval
+            if use_roi:
+                window = search_window(last_faces, roi_padding, gray.shape[1], gray.shape[0])
+                faces = detect_faces(face_detector, frame, gray, window)
+            if faces:
+                frames_since_full += 1
+            else:
+                use_roi = False
+                faces = detect_faces(face_detector, frame, gray)
+                frames_since_full = 0
+            last_faces = faces
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            timings['roi' if use_roi else 'completo'].append(elapsed_ms)
+            cv2.putText(frame, f'Deteccion: {elapsed_ms:.1f} ms ({"ROI" if use_roi else "completo"})',
+                        (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
 
             for (x, y, w, h) in faces:
                 # Dibujar rectángulo y mostrar contador
@@ -53,14 +174,24 @@ def capture_faces(person_name, max_images=300, min_confidence=1.3):
                 cv2.putText(frame, f'Imagenes: {count}', (10, 25),
                             cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
 
-                # Procesar y guardar el rostro
-                face = aux_frame[y:y+h, x:x+w]
-                face = cv2.resize(face, (150, 150), interpolation=cv2.INTER_CUBIC)
-
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f'rostro_{count}_{timestamp}.jpg'
-                cv2.imwrite(os.path.join(person_path, filename), face)
-                count += 1
+                # Omitir rostros casi idénticos a los ya guardados
+                face_hash = difference_hash(gray[y:y+h, x:x+w])
+                if min_hash_distance > 0 and is_near_duplicate(face_hash, kept_hashes, min_hash_distance):
+                    duplicates += 1
+                    continue
+
+                # Procesar y encolar el rostro para guardarlo
+                if dataset is not None:
+                    face = cv2.resize(gray[y:y+h, x:x+w], FACE_SIZE[::-1], interpolation=cv2.INTER_CUBIC)
+                    queued = writer.submit(face)
+                else:
+                    face = aux_frame[y:y+h, x:x+w]
+                    face = cv2.resize(face, FACE_SIZE[::-1], interpolation=cv2.INTER_CUBIC)
+                    filename = f'rostro_{count}_{session}.jpg'
+                    queued = writer.submit(os.path.join(person_path, filename), face)
+                if queued:
+                    kept_hashes.append(face_hash)
+                    count += 1
 
             cv2.imshow('Captura de Rostros', frame)
 
@@ -75,7 +206,15 @@ def capture_faces(person_name, max_images=300, min_confidence=1.3):
     finally:
         cap.release()
         cv2.destroyAllWindows()
-        print(f"Captura finalizada. Se guardaron {count} imágenes")
+        writer.close()
+        if dataset is not None:
+            dataset.close()
+        print(f"Captura finalizada. Se guardaron {writer.saved} imágenes "
+              f"({duplicates} casi duplicadas omitidas, {writer.failed} errores de escritura)")
+        for mode, values in timings.items():
+            if values:
+                print(f"Detección {mode}: {len(values)} frames, media {np.mean(values):.1f} ms, "
+                      f"p95 {np.percentile(values, 95):.1f} ms")
 
 if __name__ == "__main__":
     capture_faces("conductor")
@@ -0,0 +1,171 @@
+# Dataset empaquetado de rostros: todas las imágenes 150x150 en un único archivo mapeable en memoria
+
+import os
+import json
+import uuid
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+from archivos_registros import write_json
+
+FACE_SIZE = (150, 150)
+FACES_FILE = "rostros.bin"      # N x 150 x 150 uint8 (escala de grises), uno tras otro
+LABELS_FILE = "etiquetas.bin"   # N x int32, etiqueta de cada rostro
+INDEX_FILE = "indice.json"      # versión, tamaño, identificador y nombres de las personas (posición = etiqueta)
+DATASET_VERSION = 1
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def is_packed_dataset(path: str) -> bool:
+    """True si la carpeta contiene un dataset empaquetado"""
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+
+class PackedFaceDataset:
+    def __init__(self, path: str):
+        """
+        Abre (o crea) un dataset empaquetado en la carpeta `path`.
+        Los rostros se añaden al final de los archivos, así que capturar más imágenes no reescribe
+        las existentes; al leer, los arrays se mapean en memoria sin copiarlos.
+        Args:
+            path (str): Carpeta del dataset
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.faces_path = os.path.join(path, FACES_FILE)
+        self.labels_path = os.path.join(path, LABELS_FILE)
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != DATASET_VERSION or tuple(index.get('tamano', ())) != FACE_SIZE:
+                raise ValueError(f"Dataset no compatible en {path}: {index}")
+            self.people = index['personas']
+            self.dataset_id = index.get('id')
+        else:
+            self.people = []
+            self.dataset_id = None
+
+        # Una escritura interrumpida puede dejar un rostro sin etiqueta (o al revés): se ignora
+        self.count = self._rows()
+        # Identificador del contenido: cambia si el dataset se vacía o se crea de nuevo en la misma
+        # carpeta, para que quien guarde referencias a sus filas (el manifiesto del modelo) no las confunda
+        if self.dataset_id is None or self.count == 0:
+            self.dataset_id = uuid.uuid4().hex
+            self._save_index()
+        self._faces_file = None
+        self._labels_file = None
+
+    def _rows(self) -> int:
+        face_bytes = FACE_SIZE[0] * FACE_SIZE[1]
+        faces = os.path.getsize(self.faces_path) // face_bytes if os.path.exists(self.faces_path) else 0
+        labels = os.path.getsize(self.labels_path) // 4 if os.path.exists(self.labels_path) else 0
+        return min(faces, labels)
+
+    def _save_index(self):
+        write_json(self.index_path, {'version': DATASET_VERSION, 'tamano': list(FACE_SIZE), 'id': self.dataset_id,
+                                     'personas': self.people}, ensure_ascii=False, indent=2)
+
+    def label_for(self, person_name: str) -> int:
+        """Etiqueta de la persona; si es nueva se añade al índice"""
+        with self.lock:
+            if person_name not in self.people:
+                self.people.append(person_name)
+                self._save_index()
+            return self.people.index(person_name)
+
+    def append(self, faces: np.ndarray, label: int) -> bool:
+        """
+        Añade uno o varios rostros de una persona
+        Args:
+            faces (np.ndarray): Rostro (150, 150) o rostros (n, 150, 150) en escala de grises
+            label (int): Etiqueta de label_for()
+        """
+        faces = np.ascontiguousarray(faces, dtype=np.uint8).reshape(-1, *FACE_SIZE)
+        labels = np.full(len(faces), label, dtype='<i4')
+        with self.lock:
+            if self._faces_file is None:
+                # Recorta restos de una escritura interrumpida antes de seguir añadiendo
+                self._truncate(self.count)
+                self._faces_file = open(self.faces_path, 'ab')
+                self._labels_file = open(self.labels_path, 'ab')
+            self._faces_file.write(faces.tobytes())
+            self._labels_file.write(labels.tobytes())
+            self.count += len(faces)
+        return True
+
+    def _truncate(self, rows: int):
+        for path, row_bytes in ((self.faces_path, FACE_SIZE[0] * FACE_SIZE[1]), (self.labels_path, 4)):
+            with open(path, 'ab') as f:
+                f.truncate(rows * row_bytes)
+
+    def close(self):
+        with self.lock:
+            for f in (self._faces_file, self._labels_file):
+                if f is not None:
+                    f.close()
+            self._faces_file = self._labels_file = None
+
+    def load(self):
+        """
+        Mapea el dataset en memoria
+        Returns:
+            tuple: (rostros (N, 150, 150) uint8, etiquetas (N,) int32) de solo lectura
+        """
+        self.close()
+        rows = self._rows()
+        if rows == 0:
+            return np.zeros((0, *FACE_SIZE), dtype=np.uint8), np.zeros(0, dtype='<i4')
+        faces = np.memmap(self.faces_path, dtype=np.uint8, mode='r', shape=(rows, *FACE_SIZE))
+        labels = np.memmap(self.labels_path, dtype='<i4', mode='r', shape=(rows,))
+        return faces, labels
+
+
+def convert_folders(data_path: str, dataset_path: str) -> PackedFaceDataset:
+    """
+    Convierte las carpetas captura/<persona>/ en un dataset empaquetado
+    Las imágenes se pasan a escala de grises y, si hace falta, se redimensionan a 150x150.
+    """
+    dataset = PackedFaceDataset(dataset_path)
+    if dataset.count:
+        raise ValueError(f"El dataset {dataset_path} ya contiene rostros; usa una carpeta vacía")
+    for person_name in sorted(os.listdir(data_path)):
+        person_path = os.path.join(data_path, person_name)
+        if not os.path.isdir(person_path):
+            continue
+        label = dataset.label_for(person_name)
+        faces = []
+        for filename in sorted(os.listdir(person_path)):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(person_path, filename), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                print(f"No se pudo cargar la imagen: {filename}. Se omitirá.")
+                continue
+            if image.shape != FACE_SIZE:
+                image = cv2.resize(image, FACE_SIZE[::-1], interpolation=cv2.INTER_CUBIC)
+            faces.append(image)
+        if faces:
+            dataset.append(np.stack(faces), label)
+        print(f"{person_name}: {len(faces)} rostros")
+    dataset.close()
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte las carpetas de captura en un dataset empaquetado")
+    parser.add_argument('captura', help="Carpeta con una subcarpeta de imágenes por persona")
+    parser.add_argument('destino', help="Carpeta del dataset empaquetado")
+    args = parser.parse_args()
+
+    dataset = convert_folders(args.captura, args.destino)
+    print(f"Dataset con {dataset.count} rostros de {len(dataset.people)} personas en {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,356 @@
-import os
 import time
+# Instante de arranque del proceso para el informe de tiempos de inicio
+PROCESS_START = time.perf_counter()
+
+import os
+import json
+import queue
 import logging
 import threading
+import urllib.request
 from datetime import datetime
 
 import cv2
 import dlib 
 import numpy as np
-from scipy.spatial import distance as dist
-import pywhatkit as kit
-import winsound
+
+from alarma_sonora import AlarmSoundEngine
+from diario_eventos import EventJournal, setup_async_logging
+from detectores_rostro import create_face_detector
+from estado_somnolencia import (DrowsinessState, FaceTracks, calculate_ear_batch, EYE_POINTS,
+                                EVENT_CLOSED, EVENT_BEEP, EVENT_ALERT, EVENT_RESET, EVENT_FATIGUE)
+from sesiones_landmarks import SessionRecorder
+
+IMPORTS_DONE = time.perf_counter()
+
+
+def landmarks_to_array(shape, out: np.ndarray = None, indices=range(68)) -> np.ndarray:
+    """
+    Copia los puntos de un full_object_detection de dlib a un array (n, 2) int32 preasignado.
+    La API de Python de dlib no expone los puntos como búfer: cada shape.part(i) crea un
+    dlib.point, así que queda un objeto por punto; solo se evita crear listas y tuplas intermedias.
+    Args:
+        shape: Resultado del shape_predictor de dlib
+        out (np.ndarray): Array contiguo (n, 2) int32 preasignado donde escribir; se crea si es None
+        indices: Índices de los puntos a extraer (por defecto los 68)
+    Returns:
+        np.ndarray: Coordenadas (n, 2) de los puntos
+    """
+    if out is None:
+        out = np.empty((len(indices), 2), dtype=np.int32)
+    for row, i in enumerate(indices):
+        point = shape.part(i)
+        out[row, 0] = point.x
+        out[row, 1] = point.y
+    return out
+
+
+class AlertSink:
+    """Destino de las alertas. Las subclases implementan send() y lanzan una excepción si fallan."""
+
+    name = "sink"
+
+    def send(self, message: str):
+        raise NotImplementedError
+
+
+class WhatsAppSink(AlertSink):
+    """Envía la alerta por WhatsApp Web con pywhatkit (bloquea alrededor de un minuto)."""
+
+    name = "whatsapp"
+
+    def __init__(self, phone_number: str):
+        self.phone_number = phone_number
+
+    def send(self, message: str):
+        # pywhatkit.sendwhatmsg_instantly() no tiene parámetros para cerrar la pestaña.
+        # Se usa `sendwhatmsg` para programar el envío.
+        # pywhatkit prepara red e interfaz gráfica al importarse: solo se importa al enviar, en el hilo del despachador
+        import pywhatkit as kit
+        now = datetime.now()
+        current_hour = now.hour
+        current_minute = now.minute + 1
+        kit.sendwhatmsg(self.phone_number, message, current_hour, current_minute, wait_time=10, close_time=3)
+
+
+class FileSink(AlertSink):
+    """Añade cada alerta como una línea JSON a un archivo local (útil para pruebas)."""
+
+    name = "archivo"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, message: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": datetime.now().isoformat(), "message": message}) + "\n")
+
+
+class WebhookSink(AlertSink):
+    """Publica la alerta como JSON en un webhook HTTP."""
+
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, message: str):
+        data = json.dumps({"message": message}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class AlertDispatcher:
+    def __init__(self, sinks: list, cooldown: float = 60, max_queue: int = 8,
+                 max_retries: int = 3, backoff: float = 2.0):
+        """
+        Despachador de alertas en segundo plano
+        Args:
+            sinks (list): Destinos (AlertSink) a los que se envía cada alerta
+            cooldown (float): Tiempo mínimo en segundos entre alertas con la misma clave
+                              (si una alerta no llega a ningún destino no cuenta)
+            max_queue (int): Número máximo de alertas pendientes; las nuevas se descartan si está llena
+            max_retries (int): Reintentos por destino antes de dar la alerta por perdida
+            backoff (float): Espera inicial en segundos entre reintentos (se duplica en cada intento)
+        """
+        self.sinks = sinks
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Última alerta aceptada por clave (p. ej. tipo de alerta e ID del rostro); la comparten
+        # submit() y el hilo despachador, que la borra si la alerta no se pudo entregar
+        self.last_alert_time = {}
+        self._lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._running = threading.Event()
+        self._running.set()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, message: str, key=None) -> bool:
+        """
+        Encola una alerta sin bloquear. Devuelve False si se omitió por cooldown o cola llena.
+        El cooldown es independiente para cada clave (tipo de alerta y rostro): la alerta de un rostro
+        no silencia la de otro, ni un aviso de fatiga la alerta de ojos cerrados.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self.last_alert_time.get(key, -self.cooldown) < self.cooldown:
+                logging.info(f"Alert cooldown activo para {key}, no se envía la alerta.")
+                return False
+            try:
+                self.queue.put_nowait((message, key, now, time.perf_counter()))
+            except queue.Full:
+                logging.warning("Cola de alertas llena, se descarta la alerta.")
+                return False
+            # Las claves con el cooldown vencido ya no hacen falta (rostros que se fueron)
+            self.last_alert_time = {k: t for k, t in self.last_alert_time.items() if now - t < self.cooldown}
+            self.last_alert_time[key] = now
+        return True
+
+    def stop(self, timeout: float = 1.0):
+        """Detiene el hilo despachador; las alertas pendientes que no se envíen a tiempo se pierden."""
+        self._running.clear()
+        self._worker.join(timeout)
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                message, key, accepted, submitted = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            delivered = [self._deliver(sink, message, submitted) for sink in self.sinks]
+            if not any(delivered):
+                # Nadie recibió la alerta: la siguiente de la misma clave no debe esperar al cooldown
+                with self._lock:
+                    if self.last_alert_time.get(key) == accepted:
+                        del self.last_alert_time[key]
+
+    def _deliver(self, sink: AlertSink, message: str, submitted: float) -> bool:
+        """Envía la alerta a un destino con reintentos; devuelve True si se entregó"""
+        delay = self.backoff
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                sink.send(message)
+                latency = time.perf_counter() - submitted
+                logging.info(f"Alerta enviada por {sink.name} en {latency:.2f}s (intento {attempt})")
+                return True
+            except Exception as e:
+                logging.error(f"Error enviando alerta por {sink.name} (intento {attempt}): {e}")
+            if attempt > self.max_retries or not self._running.is_set():
+                break
+            time.sleep(delay)
+            delay *= 2
+        logging.error(f"Alerta descartada para {sink.name} tras {attempt} intentos.")
+        return False
+
+
+class StartupReport:
+    """Marcas de tiempo del arranque, en segundos desde PROCESS_START, hasta el primer frame procesado"""
+
+    def __init__(self):
+        self.marks = [("imports", IMPORTS_DONE - PROCESS_START)]
+        self.lock = threading.Lock()
+        self.reported = False
+
+    def mark(self, name: str):
+        with self.lock:
+            self.marks.append((name, time.perf_counter() - PROCESS_START))
+
+    def report(self):
+        """Registra el desglose una sola vez"""
+        if self.reported:
+            return
+        self.reported = True
+        with self.lock:
+            marks = sorted(self.marks, key=lambda m: m[1])
+        logging.info("Arranque: " + ", ".join(f"{name} {t:.2f}s" for name, t in marks))
+
 
 class DrowsinessDetector:
     def __init__(self, predictor_path: str, phone_number: str,
                  ear_threshold: float = 0.25, alert_cooldown: int = 60, 
-                 beep_cooldown: float = 1.0):
+                 beep_cooldown: float = 1.0, alert_sinks: list = None,
+                 detect_interval: int = 5, min_track_quality: float = 7.0,
+                 face_detector: str = "hog", detector_options: dict = None,
+                 audio_backend: str = "auto", record_path: str = None,
+                 max_face_age: float = 2.0, metrics_window: float = 60.0,
+                 perclos_threshold: float = 0.15, metrics_log_interval: float = 30.0):
         """
         Detector de somnolencia optimizado
         Args: 
             predictor_path (str): Ruta al archivo shape_predictor_68_face_landmarks.dat
             phone_number (str): Número de teléfono para enviar alertas de WhatsApp en formato internacional (ejemplo: "+34123456789")
             ear_threshold (float): Umbral del Eye Aspect Ratio (EAR) para detectar ojos cerrados
-            alert_cooldown (int): Tiempo en segundos entre alertas de WhatsApp
+            alert_cooldown (int): Tiempo en segundos entre alertas de WhatsApp de un mismo rostro
             beep_cooldown (float): Tiempo en segundos entre pitidos de alerta sonora
+            alert_sinks (list): Destinos de las alertas (AlertSink); por defecto WhatsApp a phone_number
+            detect_interval (int): Cada cuántos frames se ejecuta el detector completo; entre medias se siguen los rostros (1 = detectar siempre)
+            min_track_quality (float): Calidad mínima del seguimiento (PSR de dlib) antes de forzar una nueva detección
+            face_detector (str): Detector de rostros a usar: "hog", "haar" o "dnn"
+            detector_options (dict): Parámetros adicionales para el detector elegido
+            audio_backend (str): Backend de sonido: "auto", "sounddevice", "winsound" o "null" (silencioso)
+            record_path (str): Si se indica, graba los landmarks de cada frame en este archivo de sesión (.lmk)
+            max_face_age (float): Segundos sin ver un rostro antes de descartar su estado de somnolencia
+            metrics_window (float): Ventana en segundos de PERCLOS, parpadeos por minuto y duración media de cierre
+            perclos_threshold (float): PERCLOS (0..1) a partir del cual se avisa de fatiga (None para desactivar)
+            metrics_log_interval (float): Cada cuántos segundos se registran las métricas de fatiga en el diario de eventos
         """
         #consecutive_frames: int = 20,
         #alert_sound_path: str = "alert.wav",
         #log_file: str = "drowsiness_log.txt"):
 
-        self.ear_threshold = ear_threshold
+        self.startup = StartupReport()
         self.phone_number = phone_number
-        self.alert_cooldown = alert_cooldown
-        self.beep_cooldown = beep_cooldown
 
-        self.start_time = None
-        self.last_alert_time = 0
-        self.last_beep_time = 0
-        self.alert_active = False
+        # Ojos cerrados, pitidos progresivos y escalado a alerta (sin dependencias de cámara)
+        self.state = DrowsinessState(ear_threshold, beep_cooldown, metrics_window=metrics_window,
+                                     perclos_threshold=perclos_threshold)
+        self.metrics_log_interval = metrics_log_interval
+        self.last_metrics_log = time.time()
+        self.beep_frequencies = self.state.beep_frequencies
+        # Estado independiente por ocupante, identificado por un ID de seguimiento
+        # Al descartar un rostro se libera también su estado en el diario de eventos
+        self.face_tracks = FaceTracks(max_age=max_face_age, on_evict=lambda tid: self.journal.forget(tid))
 
-        # Frecuencias progresivas por segundo (1...4+)
-        self.beep_frequencies = {1: 500, 2: 750, 3: 1000, 4: 1500}
+        # Todos los tonos de alarma se sintetizan una vez y los reproduce un único hilo
+        self.sound_engine = AlarmSoundEngine(self.state.tones(), backend=audio_backend)
         
-        # Inicialización del detector y predictor de dlib
-        self.detector = dlib.get_frontal_face_detector()
-        self.predictor = dlib.shape_predictor(predictor_path)
+        # El detector de rostros y el predictor de dlib (~100 MB) se cargan en segundo plano
+        # mientras se abre la cámara; process_frame no analiza hasta que estén listos.
+        # dlib no libera el GIL al cargar, pero OpenCV sí al abrir y leer la cámara, así que ambas esperas se solapan
+        self.detector = None
+        self.predictor = None
+        self.models_ready = threading.Event()
+        self.model_error = None
+        self._model_loader = threading.Thread(
+            target=self._load_models,
+            args=(predictor_path, face_detector, detector_options or {}),
+            daemon=True)
+
+        # Búfer reutilizable con los puntos de los ojos: (rostros, ojo, punto, xy)
+        self.eye_points = np.empty((1, 2, 6, 2), dtype=np.int32)
+
+        # Seguimiento de rostros entre detecciones completas
+        self.detect_interval = detect_interval
+        self.min_track_quality = min_track_quality
+        self.trackers = []
+        self.frames_since_detection = 0
 
         self.setup_logging()
+
+        # Las alertas se envían desde un hilo aparte para no detener el procesamiento de frames
+        if alert_sinks is None:
+            alert_sinks = [WhatsAppSink(phone_number)]
+        self.dispatcher = AlertDispatcher(alert_sinks, cooldown=alert_cooldown)
+
+        # Grabación opcional de la sesión para reproducirla sin cámara (sesiones_landmarks.py)
+        self.recorder = SessionRecorder(record_path) if record_path else None
+        self.landmarks = np.empty((1, 68, 2), dtype=np.int32)
+
+        self._model_loader.start()
+        self.startup.mark("init")
+
+    def _load_models(self, predictor_path: str, face_detector: str, detector_options: dict):
+        try:
+            self.detector = create_face_detector(face_detector, **detector_options)
+            self.startup.mark("detector_rostros")
+            self.predictor = dlib.shape_predictor(predictor_path)
+            self.startup.mark("predictor")
+        except Exception as e:
+            self.model_error = e
+            logging.error(f"No se pudieron cargar los modelos: {e}")
+        finally:
+            self.models_ready.set()
+
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """
+        Espera a que terminen de cargarse los modelos
+        Returns:
+            bool: True si están listos; False si se agotó el tiempo de espera
+        """
+        if not self.models_ready.wait(timeout):
+            return False
+        if self.model_error is not None:
+            raise RuntimeError("No se pudieron cargar los modelos") from self.model_error
+        return True
     
+    # Los umbrales viven en la máquina de estados y el despachador; estas propiedades permiten
+    # ajustarlos después de crear el detector
+    @property
+    def ear_threshold(self) -> float:
+        return self.state.ear_threshold
+
+    @ear_threshold.setter
+    def ear_threshold(self, value: float):
+        self.state.ear_threshold = value
+
+    @property
+    def beep_cooldown(self) -> float:
+        return self.state.beep_cooldown
+
+    @beep_cooldown.setter
+    def beep_cooldown(self, value: float):
+        self.state.beep_cooldown = value
+
+    @property
+    def alert_cooldown(self) -> float:
+        return self.dispatcher.cooldown
+
+    @alert_cooldown.setter
+    def alert_cooldown(self, value: float):
+        self.dispatcher.cooldown = value
+
     def setup_logging(self):
+        """
+        Logging de texto sin bloqueo para los mensajes poco frecuentes y diario binario
+        (diario_eventos.py) para los eventos del bucle de frames
+        """
         log_dir = "logs"
-        os.makedirs(log_dir, exist_ok=True)
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            handlers=[
-                logging.FileHandler(os.path.join(log_dir, f"drowsiness_{datetime.now().strftime('%Y%m%d')}.log")),
-                logging.StreamHandler()
-            ]
-        )
+        setup_async_logging(os.path.join(log_dir, f"drowsiness_{datetime.now().strftime('%Y%m%d')}.log"))
+        self.journal = EventJournal(log_dir, prefix="drowsiness")
 
     @staticmethod
     def calculate_ear(eye: np.ndarray) -> float:
@@ -68,58 +361,89 @@ class DrowsinessDetector:
         Returns:
             float: Valor del EAR
         """
-        A = dist.euclidean(eye[1], eye[5])
-        B = dist.euclidean(eye[2], eye[4])
-        C = dist.euclidean(eye[0], eye[3])
-        
-        if C == 0:
-            return 0.0
-        return (A + B) / (2.0 * C)
+        return float(calculate_ear_batch(np.asarray(eye)))
     
-    def _beep_async(self, freq: int, dur: int):
-        """Ejecuta winsound. Beep en hilo para no bloquear el flujo principal"""
-        threading.Thread(target=winsound.Beep, args=(freq, dur), daemon=True).start()
+    def handle_events(self, events: list, frame: np.ndarray, face, ear: float, now: float):
+        """Ejecuta los eventos de la máquina de estados de un rostro: pitidos, alerta y diario"""
+        track_id = face.track_id
+        for event in events:
+            kind = event[0]
+            if kind == EVENT_CLOSED:
+                self.journal.log(kind, track_id, ear, timestamp=now)
+            elif kind == EVENT_BEEP:
+                _, freq, duration, level = event
+                self.sound_engine.play(freq, duration)
+                self.journal.log(kind, track_id, ear, face.elapsed(now), freq, level, timestamp=now)
+            elif kind == EVENT_ALERT:
+                logging.warning(f"Rostro {track_id}: alerta de somnolencia activada mas de 4s.")
+                self.journal.log(kind, track_id, ear, face.elapsed(now), timestamp=now)
+                self.draw_alert(frame)
+                self.send_alert(track_id)
+            elif kind == EVENT_RESET:
+                self.journal.log(kind, track_id, ear, event[1], timestamp=now)
+            elif kind == EVENT_FATIGUE:
+                _, perclos, blink_rate = event
+                logging.warning(f"Rostro {track_id}: signos de fatiga, PERCLOS {perclos:.0%}, {blink_rate:.0f} parpadeos/min.")
+                self.journal.log(kind, track_id, ear, face.metrics.mean_closure, perclos, blink_rate, timestamp=now)
+                msg = f"AVISO: Conductor (rostro {track_id}) con signos de fatiga (PERCLOS {perclos:.0%}). Revise al conductor"
+                # Cooldown propio: el aviso de fatiga no debe retrasar la alerta de ojos cerrados que suele seguirle
+                if self.dispatcher.submit(msg, key=(EVENT_FATIGUE, track_id)):
+                    logging.info("Aviso de fatiga encolado para su envío.")
 
-    def sound_alarm(self, frequency: int = 1000, duration_ms: int = 300):
-        """Reproduce un sonido de alerta"""
-        now = time.time()
-        if now - self.last_beep_time >= self.beep_cooldown:
-            self._beep_async(frequency, duration_ms)
-            self.last_beep_time = now
-            logging.warning(f"Alerta sonora: {frequency}Hz {duration_ms}ms")    
-
-    def send_whatsapp_alert(self):
-        """Envia mensaje WhatsApp con control de cooldown para enviar spam."""
-        now = time.time()
-        if now - self.last_alert_time < self.alert_cooldown:
-            logging.info("Alert cooldown activo, no se envía WhatsApp.")
+    def log_metrics(self, now: float):
+        """Registra periódicamente en el diario las métricas de fatiga de cada rostro seguido"""
+        if now - self.last_metrics_log < self.metrics_log_interval:
             return
-        try:
-            msg = "ALERTA: Conductor presenta ojos cerrados por >4s. Revise al conductor"
-            # pywhatkit.sendwhatmsg_instantly() no tiene parámetros para cerrar la pestaña.
-            # Se usa `sendwhatmsg` para programar el envío.
-            current_hour = datetime.now().hour
-            current_minute = datetime.now().minute + 1
-            kit.sendwhatmsg(self.phone_number, msg, current_hour, current_minute, wait_time=10, close_time=3)
-            self.last_alert_time = now
-            logging.info(f"Alerta WhatsApp enviada a {self.phone_number}")
-        except Exception as e:
-            logging.error(f"Error enviando alerta WhatsApp: {e}")
+        self.last_metrics_log = now
+        for face in self.face_tracks.tracks.values():
+            m = face.metrics
+            if m is not None:
+                self.journal.log("metricas", face.track_id, elapsed=m.mean_closure,
+                                 value=m.perclos, value2=m.blink_rate, timestamp=now)
 
-    def sound_progressive_alarm(self, elapsed: float):
-        """Reproduce pitidos progresivos según segundos de somnolencia"""
-        if elapsed < 1.0:
-            return
-        now = time.time()
-        if now - self.last_beep_time < self.beep_cooldown:
-            return
-        
-        seconds = min(int(elapsed), 4) # 1 ...4
-        freq = self.beep_frequencies.get(seconds, self.beep_frequencies[4])
-        duration = 200 + (seconds - 1) * 100 # aumentar duracion ligeramente
-        self._beep_async(freq, duration)
-        self.last_beep_time = now
-        logging.info(f"Beep progresivo: {seconds}s -> {freq}Hz {duration}ms")
+    def send_alert(self, track_id: int = 0):
+        """Encola la alerta de somnolencia sin bloquear; el despachador aplica el cooldown de cada rostro."""
+        msg = f"ALERTA: Conductor (rostro {track_id}) presenta ojos cerrados por >4s. Revise al conductor"
+        if self.dispatcher.submit(msg, key=(EVENT_ALERT, track_id)):
+            logging.info("Alerta de somnolencia encolada para su envío.")
+
+    def locate_faces(self, gray: np.ndarray, frame: np.ndarray = None) -> list:
+        """
+        Localiza los rostros del frame. El detector de rostros solo se ejecuta cada
+        detect_interval frames o cuando el seguimiento pierde calidad; en el resto
+        se actualizan los correlation trackers de dlib.
+        Args:
+            gray (np.ndarray): Frame en escala de grises
+            frame (np.ndarray): Frame BGR original, para detectores que usan color
+        Returns:
+            list: Rectángulos dlib de los rostros
+        """
+        if self.trackers and self.frames_since_detection < self.detect_interval:
+            faces = []
+            height, width = gray.shape[:2]
+            for tracker in self.trackers:
+                if tracker.update(gray) < self.min_track_quality:
+                    break
+                pos = tracker.get_position()
+                left, top = max(int(pos.left()), 0), max(int(pos.top()), 0)
+                right, bottom = min(int(pos.right()), width - 1), min(int(pos.bottom()), height - 1)
+                if right <= left or bottom <= top:
+                    break
+                faces.append(dlib.rectangle(left, top, right, bottom))
+            else:
+                self.frames_since_detection += 1
+                return faces
+
+        boxes = self.detector.detect(frame if frame is not None else gray, gray)
+        faces = [dlib.rectangle(x, y, x + w - 1, y + h - 1) for (x, y, w, h) in boxes]
+        self.frames_since_detection = 1
+        self.trackers = []
+        if self.detect_interval > 1:
+            for face in faces:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(gray, face)
+                self.trackers.append(tracker)
+        return faces
 
     def process_frame(self, frame: np.ndarray) -> np.ndarray:
         """
@@ -129,50 +453,55 @@ class DrowsinessDetector:
         Returns:
             np.ndarray: Frame procesado con anotaciones
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.detector(gray, 0)
+        if not self.wait_until_ready(0):
+            cv2.putText(frame, "Cargando modelos...", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+            return frame
 
-        for face in faces:
-            shape = self.predictor(gray, face)
-            coords = np.array([[p.x, p.y] for p in shape.parts()])
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.locate_faces(gray, frame)
+        now = time.time()
+        if not faces:
+            self.face_tracks.evict(now)
+            if self.recorder is not None:
+                self.recorder.write(now, [])
+            return frame
 
-            left_eye = coords[36:42]
-            right_eye = coords[42:48]
+        boxes = [(f.left(), f.top(), f.right(), f.bottom()) for f in faces]
+        face_states = self.face_tracks.assign(boxes, now)
 
-            left_ear = self.calculate_ear(left_eye)
-            right_ear = self.calculate_ear(right_eye)
-            ear = (left_ear + right_ear) / 2.0
+        if self.eye_points.shape[0] < len(faces):
+            self.eye_points = np.empty((len(faces), 2, 6, 2), dtype=np.int32)
+        eyes = self.eye_points[:len(faces)]
+        if self.recorder is None:
+            for i, face in enumerate(faces):
+                landmarks_to_array(self.predictor(gray, face), out=eyes[i].reshape(12, 2), indices=EYE_POINTS)
+        else:
+            # Al grabar se extraen los 68 puntos y los ojos se copian de ellos
+            if self.landmarks.shape[0] < len(faces):
+                self.landmarks = np.empty((len(faces), 68, 2), dtype=np.int32)
+            landmarks = self.landmarks[:len(faces)]
+            for i, face in enumerate(faces):
+                landmarks_to_array(self.predictor(gray, face), out=landmarks[i])
+            eyes.reshape(len(faces), 12, 2)[:] = landmarks[:, EYE_POINTS.start:EYE_POINTS.stop]
+            self.recorder.write(now, boxes, landmarks)
+        # EAR medio de ambos ojos para todos los rostros en una sola operación
+        ears = calculate_ear_batch(eyes).mean(axis=1)
 
+        status_row = 0
+        for i, ear in enumerate(ears):
+            left_eye, right_eye = eyes[i]
+            face = face_states[i]
             self.draw_eyes(frame, left_eye, right_eye)
-            
-            if ear < self.ear_threshold:
-                if self.start_time is None:
-                    self.start_time = time.time()
-                    logging.info("Ojos cerrados detectados, iniciando temporizador.")
-
-                elapsed = time.time() - self.start_time
-                # Alertas sonoras cada segundo
-                self.sound_progressive_alarm(elapsed)
-
-                # Mostrar tiempo de ojos cerrados
-                self.draw_alert_status(frame, elapsed)
-
-                # a partir de 4s: alerta mantenida + whatsapp
-                if elapsed >= 4.0:
-                    if not self.alert_active:
-                        logging.warning("Alerta de somnolencia activada mas de 4s.")
-                        self.alert_active = True
-                        # alarma continua de mayor tono
-                        self.sound_alarm(frequency=self.beep_frequencies[4], duration_ms=400)
-                        self.draw_alert(frame)
-                        self.send_whatsapp_alert()
-
-            else:
-                # resetear estado
-                if self.start_time is not None:
-                    logging.info(f"Ojos abiertos, reseteando estado de alerta después de {time.time() - self.start_time:.2f}s.")
-                    self.start_time = None
-                    self.alert_active = False
+            ear = float(ear)
+            self.handle_events(self.state.update(ear, now, face), frame, face, ear, now)
+            cv2.putText(frame, f"ID {face.track_id} PERCLOS {face.metrics.perclos:.0%}",
+                        (boxes[i][0], max(boxes[i][1] - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            if face.start_time is not None:
+                # Mostrar tiempo de ojos cerrados de cada rostro en su propia fila
+                self.draw_alert_status(frame, face.elapsed(now), face.track_id, status_row)
+                status_row += 1
+        self.log_metrics(now)
         return frame
 
     def draw_eyes(self, frame: np.ndarray, left_eye: np.ndarray, right_eye: np.ndarray):
@@ -191,19 +520,20 @@ class DrowsinessDetector:
                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
         cv2.rectangle(frame, (5, 5), (w - 5, 50), (0, 0, 255), 2)
 
-    def draw_alert_status(self, frame: np.ndarray, elapsed_time: float):
-        """Dibuja el estado de alerta en el frame"""
-        cv2.putText(frame, f"OJOS CERRADOS {elapsed_time:.1f}s", (10, 60),
+    def draw_alert_status(self, frame: np.ndarray, elapsed_time: float, track_id: int = 0, row: int = 0):
+        """Dibuja el estado de alerta de un rostro en el frame (una fila por rostro con ojos cerrados)"""
+        y = 80 * row
+        cv2.putText(frame, f"ID {track_id} OJOS CERRADOS {elapsed_time:.1f}s", (10, 60 + y),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         level = min(int(elapsed_time), 4)
-        cv2.putText(frame, f"Nivel Alerta: {level}", (10, 90),
+        cv2.putText(frame, f"Nivel Alerta: {level}", (10, 90 + y),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
         # barra de progreso (0..4s -> 0..200px)
         bar_len = int(min(elapsed_time/4.0, 1.0) * 200)
-        cv2.rectangle(frame, (10, 100), (10 + 200, 120), (50, 50, 50), 1)
+        cv2.rectangle(frame, (10, 100 + y), (10 + 200, 120 + y), (50, 50, 50), 1)
         if bar_len > 0:
-            cv2.rectangle(frame, (10, 100), (10 + bar_len, 120), (0, 0, 255), -1)
+            cv2.rectangle(frame, (10, 100 + y), (10 + bar_len, 120 + y), (0, 0, 255), -1)
 
     def run(self, cam_index: int = 0):
         """Bucle principal de captura y deteccion. """
@@ -211,6 +541,8 @@ class DrowsinessDetector:
         if not cap.isOpened():
             logging.error("No se pudo abrir la cámara con índice")
             return
+        self.startup.mark("camara")
+        first_frame = True
 
         try:
             while True:
@@ -218,9 +550,15 @@ class DrowsinessDetector:
                 if not ret:
                     logging.error("No se pudo leer el frame de la cámara.")
                     break
+                if first_frame:
+                    self.startup.mark("primer_frame")
+                    first_frame = False
 
                 frame = cv2.resize(frame, (640, int(frame.shape[0] * 640 / frame.shape[1])))
                 processed = self.process_frame(frame)
+                if not self.startup.reported and self.models_ready.is_set():
+                    self.startup.mark("primer_frame_procesado")
+                    self.startup.report()
 
                 cv2.imshow("Monitoreo Somnolencia", processed)
 
@@ -233,6 +571,15 @@ class DrowsinessDetector:
         finally:
             cap.release()
             cv2.destroyAllWindows()
+            self.dispatcher.stop()
+            self.sound_engine.stop()
+            self.journal.close()
+            if self.recorder is not None:
+                self.recorder.close()
+                logging.info(f"Sesión de landmarks guardada en {self.recorder.path}")
+            stats = self.sound_engine.latency_stats()
+            if stats['pitidos']:
+                logging.info(f"Latencia de pitidos: media {stats['media_ms']:.1f}ms, p95 {stats['p95_ms']:.1f}ms ({stats['pitidos']} pitidos)")
             logging.info("Detector finalizado.")
     
 def main():
@@ -0,0 +1,129 @@
+# Detectores de rostros intercambiables (HOG de dlib, Haar y DNN de OpenCV)
+
+import os
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DNN_PROTOTXT = os.path.join(BASE_DIR, "recursos", "deploy.prototxt")
+DNN_MODEL = os.path.join(BASE_DIR, "recursos", "res10_300x300_ssd_iter_140000.caffemodel")
+
+
+class FaceDetector:
+    """Interfaz común: detect() devuelve una lista de cajas (x, y, w, h) en píxeles."""
+
+    name = "base"
+
+    def detect(self, image: np.ndarray, gray: np.ndarray = None) -> list:
+        """
+        Detecta rostros en una imagen
+        Args:
+            image (np.ndarray): Imagen BGR o en escala de grises
+            gray (np.ndarray): Versión en grises ya calculada (opcional, evita convertir de nuevo)
+        Returns:
+            list: Cajas (x, y, w, h) de los rostros
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _gray(image: np.ndarray, gray: np.ndarray = None) -> np.ndarray:
+        if gray is not None:
+            return gray
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+class HogFaceDetector(FaceDetector):
+    """Detector HOG + SVM lineal de dlib (get_frontal_face_detector)."""
+
+    name = "hog"
+
+    def __init__(self, upsample: int = 0):
+        import dlib
+        self.detector = dlib.get_frontal_face_detector()
+        self.upsample = upsample
+
+    def detect(self, image, gray=None):
+        faces = self.detector(self._gray(image, gray), self.upsample)
+        return [(f.left(), f.top(), f.width(), f.height()) for f in faces]
+
+
+class HaarFaceDetector(FaceDetector):
+    """Clasificador en cascada de Haar de OpenCV."""
+
+    name = "haar"
+
+    def __init__(self, cascade_path: str = None, scale_factor: float = 1.3,
+                 min_neighbors: int = 5, min_size: tuple = (30, 30)):
+        if cascade_path is None:
+            cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.classifier = cv2.CascadeClassifier(cascade_path)
+        if self.classifier.empty():
+            raise ValueError(f"No se pudo cargar la cascada de Haar: {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect(self, image, gray=None):
+        faces = self.classifier.detectMultiScale(
+            self._gray(image, gray),
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size
+        )
+        return [tuple(int(v) for v in face) for face in faces]
+
+
+class DnnFaceDetector(FaceDetector):
+    """Detector SSD ResNet-10 (res10_300x300) de OpenCV DNN ejecutado en CPU."""
+
+    name = "dnn"
+
+    def __init__(self, prototxt: str = DNN_PROTOTXT, model: str = DNN_MODEL,
+                 confidence: float = 0.5, input_size: tuple = (300, 300)):
+        if not (os.path.exists(prototxt) and os.path.exists(model)):
+            raise FileNotFoundError(
+                f"Faltan los archivos del modelo DNN: {prototxt} y {model}")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = confidence
+        self.input_size = input_size
+
+    def detect(self, image, gray=None):
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, self.input_size, (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+
+        # Cada fila: [id, clase, confianza, x0, y0, x1, y1] con coordenadas normalizadas
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = np.clip(detections[:, 3:7] * [w, h, w, h], 0, [w - 1, h - 1, w - 1, h - 1]).astype(int)
+        return [(int(x0), int(y0), int(x1 - x0), int(y1 - y0)) for x0, y0, x1, y1 in boxes if x1 > x0 and y1 > y0]
+
+
+FACE_DETECTORS = {
+    HogFaceDetector.name: HogFaceDetector,
+    HaarFaceDetector.name: HaarFaceDetector,
+    DnnFaceDetector.name: DnnFaceDetector,
+}
+
+
+def create_face_detector(name: str, **options) -> FaceDetector:
+    """
+    Crea un detector de rostros por nombre
+    Args:
+        name (str): "hog", "haar" o "dnn"
+        **options: Parámetros propios del detector elegido
+    Returns:
+        FaceDetector: Detector listo para usar
+    """
+    try:
+        detector_class = FACE_DETECTORS[name]
+    except KeyError:
+        raise ValueError(f"Detector desconocido '{name}'. Opciones: {', '.join(FACE_DETECTORS)}")
+    return detector_class(**options)
@@ -0,0 +1,235 @@
+# Diario de eventos estructurado y logging sin bloqueo (la escritura a disco ocurre en un hilo aparte)
+
+import os
+import glob
+import time
+import queue
+import atexit
+import logging
+import argparse
+import threading
+import logging.handlers
+from datetime import datetime
+
+import numpy as np
+
+from archivos_registros import record_header, load_records
+
+JOURNAL_MAGIC = b"EVTJ"
+JOURNAL_VERSION = 2
+
+# Registro compacto de tamaño fijo. Significado de los campos genéricos según el evento:
+#   ojos_cerrados / reinicio: ear, elapsed = segundos cerrados (solo en reinicio)
+#   pitido: ear, elapsed, value = frecuencia Hz, value2 = nivel
+#   alerta: ear, elapsed
+#   fatiga / metricas: value = PERCLOS, value2 = parpadeos/min, elapsed = cierre medio (s)
+#   entrenamiento_imagenes: face = etiqueta, value = imágenes cargadas
+#   entrenamiento_fin: elapsed = segundos de entrenamiento, value = imágenes, value2 = personas
+# face es el ID de seguimiento del rostro, que crece durante toda la sesión (por eso int32)
+# suppressed indica cuántos eventos iguales se omitieron antes de este por el límite de frecuencia
+JOURNAL_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('event', 'u1'),
+    ('face', '<i4'),
+    ('suppressed', '<u2'),
+    ('ear', '<f4'),
+    ('elapsed', '<f4'),
+    ('value', '<f4'),
+    ('value2', '<f4'),
+])
+
+JOURNAL_EVENTS = (
+    "ojos_cerrados", "pitido", "alerta", "reinicio", "fatiga", "metricas",
+    "entrenamiento_imagenes", "entrenamiento_fin",
+)
+EVENT_CODES = {name: code for code, name in enumerate(JOURNAL_EVENTS)}
+
+# Intervalo mínimo en segundos entre eventos iguales de un mismo rostro (los parpadeos generan muchos)
+RATE_LIMITS = {"ojos_cerrados": 1.0, "reinicio": 1.0, "pitido": 0.5}
+
+
+class EventJournal:
+    def __init__(self, directory: str = "logs", prefix: str = "drowsiness", max_bytes: int = 8 * 1024 * 1024,
+                 max_queue: int = 4096, batch_rows: int = 256, rate_limits: dict = None):
+        """
+        Diario de eventos tipados escrito por un hilo aparte; log() nunca toca el disco
+        Args:
+            directory (str): Carpeta de los archivos del diario
+            prefix (str): Prefijo de los archivos: {prefix}_{AAAAMMDD}_{n}.evt
+            max_bytes (int): Tamaño a partir del cual se abre un archivo nuevo (además de uno por día)
+            max_queue (int): Eventos pendientes como máximo; si se llena se descartan y se cuentan
+            batch_rows (int): Eventos que se escriben de una vez como máximo
+            rate_limits (dict): Intervalo mínimo por tipo de evento (por defecto RATE_LIMITS)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.rate_limits = RATE_LIMITS if rate_limits is None else rate_limits
+        self.last_logged = {}
+        self.suppressed = {}
+        self.dropped = 0
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.buffer = np.zeros(batch_rows, dtype=JOURNAL_DTYPE)
+        self.file = None
+        self.file_day = None
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def log(self, event: str, face: int = -1, ear: float = np.nan, elapsed: float = np.nan,
+            value: float = np.nan, value2: float = np.nan, timestamp: float = None) -> bool:
+        """
+        Encola un evento sin bloquear. Devuelve False si se omitió por límite de frecuencia o cola llena.
+        """
+        now = time.time() if timestamp is None else timestamp
+        key = (event, face)
+        interval = self.rate_limits.get(event)
+        if interval:
+            if now - self.last_logged.get(key, -np.inf) < interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last_logged[key] = now
+        suppressed = min(self.suppressed.pop(key, 0), 0xFFFF)
+
+        try:
+            self.queue.put_nowait((now, EVENT_CODES[event], face, suppressed, ear, elapsed, value, value2))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def forget(self, face: int):
+        """
+        Olvida el límite de frecuencia de un rostro que ya no se sigue (los IDs no se reutilizan);
+        los eventos omitidos que tuviera pendientes de contar se pierden
+        """
+        for state in (self.last_logged, self.suppressed):
+            for key in [key for key in state if key[1] == face]:
+                del state[key]
+
+    def close(self, timeout: float = 2.0):
+        """Escribe los eventos pendientes y cierra el archivo"""
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._worker.join(timeout)
+        if self.dropped:
+            logging.warning(f"Diario de eventos: {self.dropped} eventos descartados por cola llena.")
+
+    def _open(self, day: str):
+        if self.file is not None:
+            self.file.close()
+        pattern = os.path.join(self.directory, f"{self.prefix}_{day}_*.evt")
+        index = len(glob.glob(pattern))
+        path = os.path.join(self.directory, f"{self.prefix}_{day}_{index}.evt")
+        self.file = open(path, 'wb')
+        self.file.write(record_header(JOURNAL_MAGIC, JOURNAL_VERSION, JOURNAL_DTYPE))
+        self.file_day = day
+
+    def _write(self, rows: list):
+        day = datetime.fromtimestamp(rows[0][0]).strftime('%Y%m%d')
+        if self.file is None or day != self.file_day or self.file.tell() >= self.max_bytes:
+            self._open(day)
+        batch = self.buffer[:len(rows)]
+        batch[:] = rows
+        self.file.write(batch.tobytes())
+        self.file.flush()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            stop = item is None
+            rows = [] if stop else [item]
+            # Agrupa lo que haya pendiente para escribir de una vez
+            while not stop and len(rows) < len(self.buffer):
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    rows.append(item)
+            if rows:
+                # Un lote erróneo se descarta pero el hilo sigue escribiendo los siguientes
+                try:
+                    self._write(rows)
+                except Exception as e:
+                    logging.error(f"Error escribiendo el diario de eventos: {e}")
+            if stop:
+                if self.file is not None:
+                    self.file.close()
+                return
+
+
+def load_journal(directory: str = "logs", day: str = None, prefix: str = "drowsiness") -> np.ndarray:
+    """
+    Carga todos los archivos de un día del diario en un único array estructurado
+    Args:
+        directory (str): Carpeta del diario
+        day (str): Día AAAAMMDD (por defecto hoy)
+        prefix (str): Prefijo de los archivos
+    Returns:
+        np.ndarray: Registros con dtype JOURNAL_DTYPE ordenados por archivo
+    """
+    day = day or datetime.now().strftime('%Y%m%d')
+    paths = glob.glob(os.path.join(directory, f"{prefix}_{day}_*.evt"))
+    paths.sort(key=lambda p: int(p.rsplit('_', 1)[1].split('.')[0]))
+
+    parts = [load_records(path, JOURNAL_MAGIC, JOURNAL_VERSION, JOURNAL_DTYPE, "un diario de eventos")
+             for path in paths]
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return np.zeros(0, dtype=JOURNAL_DTYPE)
+    return np.concatenate(parts)
+
+
+def select_events(records: np.ndarray, event: str) -> np.ndarray:
+    """Filtra los registros de un tipo de evento"""
+    return records[records['event'] == EVENT_CODES[event]]
+
+
+def setup_async_logging(log_file: str, level: int = logging.INFO):
+    """
+    Configura logging para que el hilo que registra solo encole el mensaje; un QueueListener
+    lo escribe en el archivo y la consola. Llamarla varias veces no duplica la configuración.
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return
+    directory = os.path.dirname(log_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen de un día del diario de eventos")
+    parser.add_argument('--carpeta', default="logs", help="Carpeta del diario")
+    parser.add_argument('--dia', help="Día AAAAMMDD (por defecto hoy)")
+    parser.add_argument('--prefijo', default="drowsiness", help="Prefijo de los archivos")
+    args = parser.parse_args()
+
+    records = load_journal(args.carpeta, args.dia, args.prefijo)
+    print(f"{len(records)} eventos")
+    codes, counts = np.unique(records['event'], return_counts=True)
+    for code, count in zip(codes, counts):
+        omitted = int(records['suppressed'][records['event'] == code].sum())
+        print(f"  {JOURNAL_EVENTS[code]:<24} {count:>8} (+{omitted} omitidos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,110 +2,366 @@
 
 import cv2
 import os
+import json
+import time
 import numpy as np
 import logging 
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from archivos_registros import write_json
+from dataset_rostros import PackedFaceDataset, is_packed_dataset, IMAGE_EXTENSIONS
+from diario_eventos import EventJournal, setup_async_logging
+
+# Fracción de bytes sin usar (imágenes borradas o modificadas) a partir de la cual se compacta la caché
+CACHE_COMPACT_FRACTION = 0.5
+
+
+def read_gray(image_path):
+    """Decodifica una imagen en escala de grises (cv2.imread libera el GIL, así que escala con hilos)"""
+    return cv2.imread(image_path, 0)
+
+
+class DecodedImageCache:
+    """
+    Caché en disco de imágenes ya decodificadas en escala de grises, con clave ruta+mtime+tamaño.
+    Todas las imágenes van seguidas en un único archivo que se mapea en memoria al leer; las nuevas
+    se añaden al final y solo se reescribe el índice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(path, "indice.json")
+        self.entries = {}
+        self.blob_name = None
+        self.blob = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+                self.blob_name = index['archivo']
+                self.entries = index['imagenes']
+                self._map()
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Caché de imágenes no válida en {path}, se reconstruirá: {e}")
+                self.entries = {}
+                self.blob_name = None
+
+    def _map(self):
+        self.blob = None
+        if self.entries:
+            self.blob = np.memmap(os.path.join(self.path, self.blob_name), dtype=np.uint8, mode='r')
+
+    @staticmethod
+    def key(image_path, stat=None):
+        stat = stat or os.stat(image_path)
+        return f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+    def get(self, key):
+        """Vista de solo lectura de la imagen cacheada, o None si no está"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        offset, height, width = entry
+        return self.blob[offset:offset + height * width].reshape(height, width)
+
+    def update(self, added, current_keys=None):
+        """
+        Añade imágenes al final del archivo y descarta del índice las que ya no existen.
+        Los bytes de las descartadas se recuperan al compactar, cuando superan CACHE_COMPACT_FRACTION.
+        Args:
+            added (dict): clave -> imagen en escala de grises
+            current_keys (set): Claves vigentes; las demás entradas se descartan (None las conserva todas)
+        """
+        entries = {key: entry for key, entry in self.entries.items()
+                   if current_keys is None or key in current_keys}
+        if not added and len(entries) == len(self.entries):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        if self.blob_name is None:
+            self.blob_name = f"imagenes_{time.time_ns()}.bin"
+        blob_path = os.path.join(self.path, self.blob_name)
+        with open(blob_path, 'ab') as f:
+            # Lo que quedara de una escritura interrumpida se cuenta como espacio sin usar
+            offset = f.tell()
+            for key, image in added.items():
+                f.write(np.ascontiguousarray(image).tobytes())
+                entries[key] = [offset, image.shape[0], image.shape[1]]
+                offset += image.size
+        self.entries = entries
+        self._map()
+
+        live = sum(height * width for _, height, width in entries.values())
+        if offset - live > CACHE_COMPACT_FRACTION * offset:
+            self._compact()
+        self._save_index()
+
+    def _compact(self):
+        # Archivo nuevo: el anterior puede seguir mapeado por vistas en uso
+        blob_name = f"imagenes_{time.time_ns()}.bin"
+        entries = {}
+        offset = 0
+        with open(os.path.join(self.path, blob_name), 'wb') as f:
+            for key in self.entries:
+                image = self.get(key)
+                f.write(image.tobytes())
+                entries[key] = [offset, image.shape[0], image.shape[1]]
+                offset += image.size
+        self.blob_name = blob_name
+        self.entries = entries
+        self._map()
+
+    def _save_index(self):
+        write_json(self.index_path, {'archivo': self.blob_name, 'imagenes': self.entries})
+
+        for name in os.listdir(self.path):
+            if name.startswith("imagenes_") and name != self.blob_name:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass # sigue mapeado (Windows); se borrará la próxima vez
+
 
 class FaceModelTrainer:
-    def __init__(self, data_path, model_path):
+    def __init__(self, data_path, model_path, cache_path=None, workers=None, incremental=True):
         """
         Inicializa el entrenador del modelo facial
         Args:
-            data_path (str): Ruta a los datos de entrenamiento
+            data_path (str): Ruta a los datos de entrenamiento: carpetas por persona o dataset empaquetado (dataset_rostros.py)
             model_path (str): Ruta donde se guardará el modelo
+            cache_path (str): Carpeta de la caché de imágenes decodificadas (por defecto <data_path>_cache; False la desactiva)
+            workers (int): Hilos para decodificar imágenes (por defecto según los núcleos)
+            incremental (bool): Si el modelo y su manifiesto existen, añade solo las imágenes nuevas con update()
         """
         self.data_path = data_path
         self.model_path = model_path
+        if cache_path is None:
+            cache_path = os.path.normpath(data_path) + "_cache"
+        self.cache_path = cache_path
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.incremental = incremental
+        # Manifiesto junto al modelo: etiqueta de cada persona e imágenes ya incluidas
+        self.manifest_path = os.path.splitext(model_path)[0] + ".manifest.json"
         self.setup_logging()
 
     def setup_logging(self):
-        """Configura el sistema de logging"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(f'training_{datetime.now().strftime("%Y%m%d")}.log'),
-                logging.StreamHandler()
-            ]
-        )
-        
-    def load_training_data(self):
-        """Carga las imagenes y etiquetas para el entrenamiento"""
-        faces_data = []
-        labels = []
-        label = 0
+        """Configura el logging sin bloqueo y el diario de eventos del entrenamiento"""
+        setup_async_logging(f'training_{datetime.now().strftime("%Y%m%d")}.log')
+        self.journal = EventJournal("logs", prefix="training")
         
+    def load_manifest(self):
+        """Manifiesto del modelo actual ({} si no existe o es de otros datos)"""
+        if not os.path.exists(self.manifest_path):
+            return {}
         try:
-            people_list = os.listdir(self.data_path)
-            
-            if not people_list:
-                raise ValueError(
-                    "No se encontraron carpetas de personas en la ruta especificada."
-                )
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Manifiesto no válido en {self.manifest_path}: {e}")
+            return {}
+        if manifest.get('datos') != os.path.abspath(self.data_path):
+            return {}
+        return manifest
+
+    def save_manifest(self, label_map, trained):
+        write_json(self.manifest_path,
+                   {'datos': os.path.abspath(self.data_path), 'etiquetas': label_map, 'imagenes': trained},
+                   ensure_ascii=False)
+
+    @staticmethod
+    def stable_labels(person_names, known):
+        """
+        Etiqueta de cada persona: se conservan las del manifiesto y las personas nuevas
+        reciben las siguientes en orden alfabético (no depende del orden de os.listdir)
+        """
+        label_map = dict(known)
+        next_label = max(label_map.values(), default=-1) + 1
+        for person_name in sorted(set(person_names)):
+            if person_name not in label_map:
+                label_map[person_name] = next_label
+                next_label += 1
+        return label_map
+
+    def list_training_items(self):
+        """
+        Enumera las imágenes de entrenamiento sin decodificarlas
+        Returns:
+            tuple: (personas, ids, fetch) con la persona y un identificador estable de cada imagen
+                   (ruta relativa+mtime+tamaño, o identificador del dataset empaquetado+fila), y fetch(índices),
+                   que devuelve esas imágenes (None si no se pudo leer)
+        """
+        if is_packed_dataset(self.data_path):
+            # Dataset empaquetado: vistas sobre el archivo mapeado, sin lectura ni decodificación por archivo
+            dataset = PackedFaceDataset(self.data_path)
+            faces, labels = dataset.load()
+            logging.info(f"Personas encontradas: {dataset.people}")
+            names = [dataset.people[label] for label in labels.tolist()]
+            # Con el identificador del dataset, uno reconstruido en la misma carpeta no coincide con el manifiesto
+            ids = [f"{dataset.dataset_id}#{row}" for row in range(len(faces))]
+            return names, ids, lambda indices: [faces[i] for i in indices]
+
+        people_list = sorted(os.listdir(self.data_path))
+        if not people_list:
+            raise ValueError(
+                "No se encontraron carpetas de personas en la ruta especificada."
+            )
+        
+        # --- CORRECCIÓN CLAVE 2: Indentación de logging ---
+        # Este logging debe ir FUERA del 'if not people_list'
+        logging.info(f"Personas encontradas: {people_list}") 
+
+        # Lista ordenada de imágenes por persona: el orden no depende de los hilos
+        names = []
+        paths = []
+        for person_name in people_list:
+            person_path = os.path.join(self.data_path, person_name)
             
-            # --- CORRECCIÓN CLAVE 2: Indentación de logging ---
-            # Este logging debe ir FUERA del 'if not people_list'
-            logging.info(f"Personas encontradas: {people_list}") 
-
-            for person_name in people_list:
-                person_path = os.path.join(self.data_path, person_name)
-                
-                if not os.path.isdir(person_path):
-                    continue
-                face_count = 0 
-                
-                for filename in os.listdir(person_path):
-                    if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                        continue
-
-                    image_path = os.path.join(person_path, filename)
-                    # Cargar la imagen en escala de grises (0)
-                    image = cv2.imread(image_path, 0)
-
-                    if image is None:
-                        logging.warning(f"No se pudo cargar la imagen: {image_path}. Se omitirá.")
-                        continue # Si no se carga, saltamos la imagen para evitar errores en cv2.face.LBPHFaceRecognizer.train()
-
-                    # Si la imagen es válida:
-                    faces_data.append(image)
-                    labels.append(label)
-                    face_count += 1
+            if not os.path.isdir(person_path):
+                continue
+            for filename in sorted(os.listdir(person_path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    names.append(person_name)
+                    paths.append(os.path.join(person_path, filename))
+
+        stats = [os.stat(path) for path in paths]
+        ids = [f"{os.path.relpath(path, self.data_path)}|{st.st_mtime_ns}|{st.st_size}"
+               for path, st in zip(paths, stats)]
+        return names, ids, lambda indices: self.decode_images(paths, stats, indices)
+
+    def decode_images(self, paths, stats, indices):
+        """
+        Decodifica las imágenes pedidas: las que no han cambiado salen de la caché y
+        el resto se decodifica en paralelo
+        """
+        indices = list(indices)
+        cache = DecodedImageCache(self.cache_path) if self.cache_path else None
+        keys = [DecodedImageCache.key(path, st) for path, st in zip(paths, stats)]
+        images = [cache.get(keys[i]) if cache else None for i in indices]
+        missing = [j for j, image in enumerate(images) if image is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                decoded = pool.map(read_gray, [paths[indices[j]] for j in missing])
+                for j, image in zip(missing, decoded):
+                    images[j] = image
+        logging.info(f"Imágenes: {len(indices)} ({len(indices) - len(missing)} desde caché, {len(missing)} decodificadas)")
+
+        for i, image in zip(indices, images):
+            if image is None:
+                logging.warning(f"No se pudo cargar la imagen: {paths[i]}. Se omitirá.")
 
-                logging.info(f"Procesadas {face_count} imágenes para {person_name}")
-                label += 1
+        if cache is not None:
+            # Se añaden las nuevas y se descartan las entradas de imágenes que ya no existen
+            added = {keys[indices[j]]: images[j] for j in missing if images[j] is not None}
+            cache.update(added, set(keys))
+        return images
 
-            return faces_data, labels
+    def load_training_data(self, manifest=None, incremental=False):
+        """
+        Carga las imagenes y etiquetas para el entrenamiento (etiquetas estables del manifiesto)
+        Args:
+            manifest (dict): Manifiesto del modelo (por defecto el actual; {} para ignorarlo)
+            incremental (bool): Cargar solo las imágenes que faltan en el manifiesto, si todas las
+                                que incluye siguen existiendo sin cambios (LBPH no puede olvidarlas)
+        Returns:
+            tuple: (imágenes, etiquetas, ids de las imágenes, etiqueta de cada persona,
+                    True si solo se cargaron las imágenes nuevas)
+        """
+        try:
+            if manifest is None:
+                manifest = self.load_manifest()
+            names, ids, fetch = self.list_training_items()
+            label_map = self.stable_labels(names, manifest.get('etiquetas', {}))
+
+            trained = manifest.get('imagenes', {})
+            current = {image_id: label_map[name] for name, image_id in zip(names, ids)}
+            only_new = incremental and bool(trained) and all(
+                current.get(image_id) == label for image_id, label in trained.items())
+            if incremental and trained and not only_new:
+                logging.info("Hay imágenes entrenadas eliminadas o modificadas: reentrenamiento completo.")
+
+            indices = [i for i, image_id in enumerate(ids) if image_id not in trained] if only_new else range(len(ids))
+            faces_data = []
+            labels = []
+            loaded_ids = []
+            for i, image in zip(indices, fetch(indices)):
+                # Si no se carga, saltamos la imagen para evitar errores en cv2.face.LBPHFaceRecognizer.train()
+                if image is not None:
+                    faces_data.append(image)
+                    labels.append(label_map[names[i]])
+                    loaded_ids.append(ids[i])
+            self.log_counts(label_map, labels)
+            return faces_data, labels, loaded_ids, label_map, only_new
 
         except Exception as e:
             logging.error(f"Error al cargar los datos: {str(e)}")
             raise 
 
+    def log_counts(self, label_map, labels):
+        counts = np.bincount(np.array(labels, dtype=int), minlength=len(label_map))
+        for person_name, label in label_map.items():
+            if counts[label]:
+                logging.info(f"Procesadas {counts[label]} imágenes para {person_name}")
+                self.journal.log("entrenamiento_imagenes", label, value=counts[label])
+
     def train_model(self):
-        """Entrena el modelo LBPH con las imágenes cargadas"""
+        """
+        Entrena el modelo LBPH. En modo incremental, si el manifiesto coincide con los datos,
+        carga el modelo existente y solo pasa por update() las imágenes nuevas; si se eliminaron
+        o modificaron imágenes ya entrenadas reentrena desde cero.
+        """
         try:
-            faces_data, labels = self.load_training_data()
+            manifest = self.load_manifest()
+            incremental = self.incremental and os.path.exists(self.model_path)
+            faces_data, labels, new_ids, label_map, only_new = self.load_training_data(manifest, incremental)
 
+            if only_new and not faces_data:
+                logging.info("El modelo ya incluye todas las imágenes; no hay nada que entrenar.")
+                return True
             if not faces_data:
                 raise ValueError(
                     "No se encontraron datos válidos para entrenar"
                 )
-            logging.info("Iniciando entrenamiento del modelo...") 
+            start = time.perf_counter()
 
             face_recognizer = cv2.face.LBPHFaceRecognizer_create()
             # np.array(labels) asegura que las etiquetas sean un numpy array, necesario para el entrenamiento
-            face_recognizer.train(faces_data, np.array(labels))
+            if only_new:
+                logging.info(f"Actualizando el modelo con {len(faces_data)} imágenes nuevas...")
+                face_recognizer.read(self.model_path)
+                face_recognizer.update(faces_data, np.array(labels))
+                trained = dict(manifest['imagenes'])
+            else:
+                logging.info("Iniciando entrenamiento del modelo...") 
+                face_recognizer.train(faces_data, np.array(labels))
+                trained = {}
+            trained.update(zip(new_ids, labels))
+            for person_name, label in label_map.items():
+                face_recognizer.setLabelInfo(label, person_name)
 
             # Crear directorio si no existe
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
 
             face_recognizer.write(self.model_path)
+            self.save_manifest(label_map, trained)
             logging.info(f"Modelo guardado exitosamente en {self.model_path}")
+            self.journal.log("entrenamiento_fin", elapsed=time.perf_counter() - start,
+                             value=len(faces_data), value2=len(label_map))
 
             return True
 
         except Exception as e:
             logging.error(f"Error durante el entrenamiento: {str(e)}")
             return False
+
+    def close(self):
+        """Escribe los eventos pendientes del diario y lo cierra; el entrenador ya no debe usarse"""
+        self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
             
 def main():
     # 1. Obtener el directorio base (donde se ejecuta este script)
@@ -117,8 +373,8 @@ def main():
     model_path = os.path.join(base_dir, 'modelos', 'modeloLBPHFace.xml')
     # --------------------------------------------------------
 
-    trainer = FaceModelTrainer(data_path, model_path)
-    trainer.train_model()
+    with FaceModelTrainer(data_path, model_path) as trainer:
+        trainer.train_model()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
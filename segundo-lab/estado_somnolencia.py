@@ -0,0 +1,345 @@
+# Máquina de estados de la somnolencia, independiente de la cámara, el detector y la pantalla
+
+from array import array
+
+import numpy as np
+
+# Tipos de evento que devuelve DrowsinessState.update()
+EVENT_CLOSED = "ojos_cerrados"
+EVENT_BEEP = "pitido"
+EVENT_ALERT = "alerta"
+EVENT_RESET = "reinicio"
+EVENT_FATIGUE = "fatiga"
+
+# Índices de los ojos en el modelo de 68 puntos de dlib (izquierdo 36-41, derecho 42-47)
+EYE_POINTS = range(36, 48)
+
+# Frecuencias progresivas por segundo (1...4+)
+BEEP_FREQUENCIES = {1: 500, 2: 750, 3: 1000, 4: 1500}
+ALARM_DURATION_MS = 400
+
+# Métricas de fatiga en ventana deslizante
+METRICS_WINDOW = 60.0       # segundos de la ventana de PERCLOS y parpadeos
+METRICS_MAX_FPS = 60        # frames por segundo máximos que caben en la ventana
+MAX_FRAME_GAP = 0.5         # un hueco mayor entre frames (sin rostro) no cuenta como tiempo observado
+PERCLOS_THRESHOLD = 0.15    # fracción de tiempo con ojos cerrados que se considera fatiga
+PERCLOS_REARM = 0.10        # PERCLOS por debajo del cual se vuelve a permitir el aviso de fatiga
+
+
+def calculate_ear_batch(eyes: np.ndarray) -> np.ndarray:
+    """
+    Calcula el Eye Aspect Ratio (EAR) de varios ojos a la vez
+    Args:
+        eyes (np.ndarray): Coordenadas (..., 6, 2) de los puntos de cada ojo, p. ej. (n_rostros, 6, 2)
+    Returns:
+        np.ndarray: EAR con la forma de eyes sin los dos últimos ejes (0.0 si el ojo es degenerado)
+    """
+    # Distancias verticales p1-p5, p2-p4 y horizontal p0-p3 de cada ojo
+    d = eyes[..., [1, 2, 0], :].astype(np.float32) - eyes[..., [5, 4, 3], :]
+    norms = np.sqrt(np.einsum("...ij,...ij->...i", d, d))
+    width = norms[..., 2]
+    return np.divide(norms[..., 0] + norms[..., 1], 2.0 * width,
+                     out=np.zeros_like(width), where=width > 0)
+
+
+def beep_duration(seconds: int) -> int:
+    """Duración en ms del pitido progresivo para el nivel 1..4"""
+    return 200 + (seconds - 1) * 100 # aumentar duracion ligeramente
+
+
+def box_iou(a: tuple, b: tuple) -> float:
+    """IoU de dos cajas (left, top, right, bottom) con coordenadas inclusivas"""
+    iw = min(a[2], b[2]) - max(a[0], b[0]) + 1
+    ih = min(a[3], b[3]) - max(a[1], b[1]) + 1
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    area_a = (a[2] - a[0] + 1) * (a[3] - a[1] + 1)
+    area_b = (b[2] - b[0] + 1) * (b[3] - b[1] + 1)
+    return inter / (area_a + area_b - inter)
+
+
+class EyeMetrics:
+    """
+    PERCLOS, frecuencia de parpadeo y duración media de los cierres en una ventana deslizante.
+    Anillos de tamaño fijo con sumas acumuladas: cada update() cuesta O(1) sea cual sea la ventana.
+    """
+
+    __slots__ = ('window', 'times', 'closed_time', 'observed', 'head', 'count',
+                 'closed_sum', 'observed_sum', 'last_time', 'closure_start',
+                 'closure_ends', 'closure_durations', 'closure_head', 'closure_count', 'closure_sum')
+
+    def __init__(self, window: float = METRICS_WINDOW, max_fps: int = METRICS_MAX_FPS):
+        capacity = int(window * max_fps)
+        self.window = window
+        # Por frame: marca de tiempo, tiempo con ojos cerrados y tiempo observado
+        self.times = array('d', bytes(8 * capacity))
+        self.closed_time = array('d', bytes(8 * capacity))
+        self.observed = array('d', bytes(8 * capacity))
+        self.head = 0
+        self.count = 0
+        self.closed_sum = 0.0
+        self.observed_sum = 0.0
+        self.last_time = None
+
+        # Por cierre de ojos terminado: instante de apertura y duración
+        closures = max(int(window * 4), 16)
+        self.closure_start = None
+        self.closure_ends = array('d', bytes(8 * closures))
+        self.closure_durations = array('d', bytes(8 * closures))
+        self.closure_head = 0
+        self.closure_count = 0
+        self.closure_sum = 0.0
+
+    def update(self, closed: bool, now: float):
+        """Añade un frame con el estado de los ojos"""
+        dt = 0.0 if self.last_time is None else min(now - self.last_time, MAX_FRAME_GAP)
+        self.last_time = now
+
+        capacity = len(self.times)
+        if self.count == capacity:
+            self._pop_frame()
+        i = (self.head + self.count) % capacity
+        self.times[i] = now
+        self.closed_time[i] = dt if closed else 0.0
+        self.observed[i] = dt
+        self.closed_sum += self.closed_time[i]
+        self.observed_sum += dt
+        self.count += 1
+
+        if closed:
+            if self.closure_start is None:
+                self.closure_start = now
+        elif self.closure_start is not None:
+            self._push_closure(now, now - self.closure_start)
+            self.closure_start = None
+
+        # Descarta lo que ha salido de la ventana (amortizado O(1))
+        limit = now - self.window
+        while self.count and self.times[self.head] < limit:
+            self._pop_frame()
+        while self.closure_count and self.closure_ends[self.closure_head] < limit:
+            self._pop_closure()
+
+    def _pop_frame(self):
+        self.closed_sum -= self.closed_time[self.head]
+        self.observed_sum -= self.observed[self.head]
+        self.head = (self.head + 1) % len(self.times)
+        self.count -= 1
+
+    def _push_closure(self, end: float, duration: float):
+        capacity = len(self.closure_ends)
+        if self.closure_count == capacity:
+            self._pop_closure()
+        i = (self.closure_head + self.closure_count) % capacity
+        self.closure_ends[i] = end
+        self.closure_durations[i] = duration
+        self.closure_sum += duration
+        self.closure_count += 1
+
+    def _pop_closure(self):
+        self.closure_sum -= self.closure_durations[self.closure_head]
+        self.closure_head = (self.closure_head + 1) % len(self.closure_ends)
+        self.closure_count -= 1
+
+    @property
+    def perclos(self) -> float:
+        """Fracción del tiempo observado en la ventana con los ojos cerrados (0..1)"""
+        return self.closed_sum / self.observed_sum if self.observed_sum > 0 else 0.0
+
+    @property
+    def blink_rate(self) -> float:
+        """Cierres de ojos por minuto en la ventana"""
+        return self.closure_count * 60.0 / self.window
+
+    @property
+    def mean_closure(self) -> float:
+        """Duración media en segundos de los cierres terminados en la ventana"""
+        return self.closure_sum / self.closure_count if self.closure_count else 0.0
+
+    @property
+    def coverage(self) -> float:
+        """Fracción de la ventana que ya tiene datos (la métrica es fiable cerca de 1)"""
+        return min(self.observed_sum / self.window, 1.0)
+
+
+class FaceState:
+    """Estado de somnolencia de un rostro seguido; __slots__ mantiene fijo el coste por rostro."""
+
+    __slots__ = ('track_id', 'box', 'last_seen', 'start_time', 'last_beep_time', 'alert_active',
+                 'metrics', 'fatigue_active')
+
+    def __init__(self, track_id: int, box: tuple = None, now: float = 0.0):
+        self.track_id = track_id
+        self.box = box
+        self.last_seen = now
+        self.start_time = None
+        self.last_beep_time = 0
+        self.alert_active = False
+        self.metrics = None
+        self.fatigue_active = False
+
+    def elapsed(self, now: float) -> float:
+        """Segundos con los ojos cerrados (0 si están abiertos)"""
+        return 0.0 if self.start_time is None else now - self.start_time
+
+
+class FaceTracks:
+    def __init__(self, iou_threshold: float = 0.3, max_age: float = 2.0, max_tracks: int = 64,
+                 on_evict=None):
+        """
+        Asigna un ID de seguimiento estable a cada caja comparándola con las del frame anterior
+        Args:
+            iou_threshold (float): IoU mínimo para considerar que una caja es el mismo rostro
+            max_age (float): Segundos sin ver un rostro antes de descartar su estado
+            max_tracks (int): Rostros seguidos como máximo; al superarlo se descartan los más antiguos
+            on_evict: Función que recibe el ID de cada rostro descartado (para liberar estado asociado)
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.max_tracks = max_tracks
+        self.on_evict = on_evict
+        self.tracks = {}
+        self.next_id = 0
+
+    def assign(self, boxes: list, now: float) -> list:
+        """
+        Empareja las cajas del frame con los rostros seguidos (voraz por mayor IoU)
+        Args:
+            boxes (list): Cajas (left, top, right, bottom) del frame
+            now (float): Marca de tiempo del frame
+        Returns:
+            list: FaceState de cada caja, en el mismo orden
+        """
+        # Pocos rostros por frame: la comparación en Python puro es más rápida que con NumPy
+        pairs = []
+        for i, box in enumerate(boxes):
+            for track in self.tracks.values():
+                overlap = box_iou(box, track.box)
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, i, track))
+        pairs.sort(key=lambda p: p[0], reverse=True)
+
+        assigned = [None] * len(boxes)
+        used = set()
+        for _, i, track in pairs:
+            if assigned[i] is None and track.track_id not in used:
+                assigned[i] = track
+                used.add(track.track_id)
+
+        for i, box in enumerate(boxes):
+            track = assigned[i]
+            if track is None:
+                track = FaceState(self.next_id, box, now)
+                self.tracks[self.next_id] = track
+                self.next_id += 1
+                assigned[i] = track
+            track.box = box
+            track.last_seen = now
+
+        self.evict(now)
+        return assigned
+
+    def evict(self, now: float):
+        """Descarta los rostros no vistos en max_age segundos y, si sobran, los más antiguos"""
+        stale = [tid for tid, track in self.tracks.items() if now - track.last_seen > self.max_age]
+        for tid in stale:
+            del self.tracks[tid]
+        if len(self.tracks) > self.max_tracks:
+            oldest = sorted(self.tracks.values(), key=lambda t: t.last_seen)
+            for track in oldest[:len(self.tracks) - self.max_tracks]:
+                del self.tracks[track.track_id]
+                stale.append(track.track_id)
+        if self.on_evict is not None:
+            for tid in stale:
+                self.on_evict(tid)
+
+
+class DrowsinessState:
+    def __init__(self, ear_threshold: float = 0.25, beep_cooldown: float = 1.0,
+                 alert_after: float = 4.0, beep_frequencies: dict = None,
+                 metrics_window: float = METRICS_WINDOW, perclos_threshold: float = PERCLOS_THRESHOLD):
+        """
+        Lógica de ojos cerrados, pitidos progresivos y escalado a alerta.
+        No usa el reloj: cada llamada a update() recibe la marca de tiempo del frame,
+        así el mismo código sirve en vivo y al reproducir sesiones grabadas.
+        El estado de cada rostro vive en un FaceState; sin rostro se usa uno por defecto.
+        Args:
+            ear_threshold (float): Umbral del EAR por debajo del cual los ojos se consideran cerrados
+            beep_cooldown (float): Tiempo en segundos entre pitidos de un mismo rostro
+            alert_after (float): Segundos con los ojos cerrados hasta la alerta
+            beep_frequencies (dict): Frecuencia del pitido por segundo de somnolencia (1..4)
+            metrics_window (float): Ventana en segundos de PERCLOS y frecuencia de parpadeo
+            perclos_threshold (float): PERCLOS a partir del cual se avisa de fatiga (None para no avisar)
+        """
+        self.ear_threshold = ear_threshold
+        self.beep_cooldown = beep_cooldown
+        self.alert_after = alert_after
+        self.beep_frequencies = dict(beep_frequencies or BEEP_FREQUENCIES)
+        self.metrics_window = metrics_window
+        self.perclos_threshold = perclos_threshold
+        self.default_face = FaceState(0)
+
+    def tones(self) -> list:
+        """Pares (frecuencia, duración ms) que puede emitir update(), para pre-sintetizarlos"""
+        tones = [(freq, beep_duration(seconds)) for seconds, freq in self.beep_frequencies.items()]
+        tones.append((self.beep_frequencies[4], ALARM_DURATION_MS))
+        return tones
+
+    def _beep(self, events: list, face: FaceState, now: float, frequency: int, duration_ms: int, level: int):
+        if now - face.last_beep_time >= self.beep_cooldown:
+            events.append((EVENT_BEEP, frequency, duration_ms, level))
+            face.last_beep_time = now
+
+    def update(self, ear: float, now: float, face: FaceState = None) -> list:
+        """
+        Avanza la máquina de estados de un rostro con su EAR
+        Args:
+            ear (float): EAR medio de ambos ojos
+            now (float): Marca de tiempo del frame en segundos
+            face (FaceState): Estado del rostro (por defecto, el de un único rostro)
+        Returns:
+            list: Eventos en orden: (EVENT_CLOSED,), (EVENT_BEEP, frecuencia, duración ms, nivel),
+                  (EVENT_ALERT,), (EVENT_RESET, segundos cerrados) y (EVENT_FATIGUE, perclos, parpadeos/min)
+        """
+        if face is None:
+            face = self.default_face
+        if face.metrics is None:
+            face.metrics = EyeMetrics(self.metrics_window)
+        closed = ear < self.ear_threshold
+        face.metrics.update(closed, now)
+
+        events = []
+        if closed:
+            if face.start_time is None:
+                face.start_time = now
+                events.append((EVENT_CLOSED,))
+
+            elapsed = now - face.start_time
+            # Pitidos progresivos cada segundo
+            if elapsed >= 1.0:
+                seconds = min(int(elapsed), 4) # 1 ...4
+                freq = self.beep_frequencies.get(seconds, self.beep_frequencies[4])
+                self._beep(events, face, now, freq, beep_duration(seconds), seconds)
+
+            # a partir de alert_after: alarma de mayor tono + alerta
+            if elapsed >= self.alert_after and not face.alert_active:
+                face.alert_active = True
+                self._beep(events, face, now, self.beep_frequencies[4], ALARM_DURATION_MS, 4)
+                events.append((EVENT_ALERT,))
+
+        elif face.start_time is not None:
+            events.append((EVENT_RESET, now - face.start_time))
+            face.start_time = None
+            face.alert_active = False
+
+        # Aviso de fatiga por PERCLOS con la ventana casi completa, una vez hasta que baje de PERCLOS_REARM
+        if self.perclos_threshold is not None:
+            metrics = face.metrics
+            perclos = metrics.perclos
+            if not face.fatigue_active and perclos >= self.perclos_threshold and metrics.coverage >= 0.9:
+                face.fatigue_active = True
+                events.append((EVENT_FATIGUE, perclos, metrics.blink_rate))
+            elif face.fatigue_active and perclos < min(PERCLOS_REARM, self.perclos_threshold):
+                face.fatigue_active = False
+        return events
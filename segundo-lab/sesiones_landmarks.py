@@ -0,0 +1,177 @@
+# Grabación y reproducción de sesiones de landmarks para ajustar el detector sin cámara
+
+import os
+import time
+import argparse
+
+import numpy as np
+
+from archivos_registros import record_header, load_records
+from estado_somnolencia import (DrowsinessState, FaceTracks, calculate_ear_batch, EYE_POINTS,
+                                EVENT_BEEP, EVENT_ALERT, EVENT_CLOSED, EVENT_FATIGUE)
+
+SESSION_MAGIC = b"LMKS"
+SESSION_VERSION = 1
+
+# Un registro por rostro y frame; los frames sin rostros se guardan con face = NO_FACE
+# para conservar sus marcas de tiempo. box = (left, top, right, bottom)
+SESSION_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('frame', '<u4'),
+    ('face', '<i2'),
+    ('box', '<i2', (4,)),
+    ('landmarks', '<i2', (68, 2)),
+])
+NO_FACE = -1
+
+
+class SessionRecorder:
+    def __init__(self, path: str, buffer_rows: int = 256):
+        """
+        Escribe una sesión de landmarks en un archivo binario de registros de tamaño fijo
+        Args:
+            path (str): Ruta del archivo de sesión (.lmk)
+            buffer_rows (int): Registros que se acumulan en memoria antes de escribirlos a disco
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(record_header(SESSION_MAGIC, SESSION_VERSION, SESSION_DTYPE))
+        self.buffer = np.zeros(buffer_rows, dtype=SESSION_DTYPE)
+        self.pending = 0
+        self.frame_index = 0
+
+    def write(self, timestamp: float, boxes: list, landmarks: np.ndarray = None):
+        """
+        Añade un frame a la sesión
+        Args:
+            timestamp (float): Marca de tiempo del frame en segundos
+            boxes (list): Rectángulos (left, top, right, bottom) de los rostros
+            landmarks (np.ndarray): Puntos (n_rostros, 68, 2) de los rostros
+        """
+        if not boxes:
+            self._append(timestamp, NO_FACE, (0, 0, 0, 0), 0)
+        for i, box in enumerate(boxes):
+            self._append(timestamp, i, box, landmarks[i])
+        self.frame_index += 1
+
+    def _append(self, timestamp, face, box, landmarks):
+        row = self.buffer[self.pending]
+        row['timestamp'] = timestamp
+        row['frame'] = self.frame_index
+        row['face'] = face
+        row['box'] = box
+        row['landmarks'] = landmarks
+        self.pending += 1
+        if self.pending == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(self.buffer[:self.pending].tobytes())
+            self.pending = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def load_session(path: str) -> np.memmap:
+    """
+    Abre una sesión grabada como array de registros mapeado en memoria (sin copiarla a RAM).
+    Un registro final incompleto (grabación interrumpida) se ignora.
+    """
+    return load_records(path, SESSION_MAGIC, SESSION_VERSION, SESSION_DTYPE, "una sesión de landmarks")
+
+
+def session_ears(records: np.ndarray) -> np.ndarray:
+    """EAR medio de ambos ojos de cada registro, calculado de una vez (NaN si no hay rostro)"""
+    eyes = records['landmarks'][:, EYE_POINTS.start:EYE_POINTS.stop].reshape(-1, 2, 6, 2)
+    ears = calculate_ear_batch(eyes).mean(axis=1)
+    ears[records['face'] == NO_FACE] = np.nan
+    return ears
+
+
+def replay_session(records: np.ndarray, ears: np.ndarray = None, max_face_age: float = 2.0,
+                   **state_options) -> dict:
+    """
+    Ejecuta la máquina de estados de DrowsinessDetector.process_frame sobre una sesión grabada,
+    con el mismo seguimiento de rostros (un estado independiente por ocupante)
+    Args:
+        records (np.ndarray): Registros de load_session()
+        ears (np.ndarray): EAR precalculado con session_ears() (para reutilizarlo en barridos)
+        max_face_age (float): Segundos sin ver un rostro antes de descartar su estado
+        **state_options: Parámetros de DrowsinessState (ear_threshold, beep_cooldown, alert_after...)
+    Returns:
+        dict: Resumen de la sesión y lista de eventos (timestamp, id de rostro, evento)
+    """
+    if ears is None:
+        ears = session_ears(records)
+    state = DrowsinessState(**state_options)
+    tracks = FaceTracks(max_age=max_face_age)
+    events = []
+    timestamps = records['timestamp']
+    if len(records) == 0:
+        return {'frames': 0, 'duracion_s': 0.0, 'rostros': 0, 'cierres': 0,
+                'pitidos': 0, 'alertas': 0, 'fatigas': 0, 'eventos': events}
+
+    # Límites de cada frame (sus registros son consecutivos)
+    frames = records['frame']
+    starts = [0] + (np.flatnonzero(frames[1:] != frames[:-1]) + 1).tolist() + [len(records)]
+    boxes = records['box'].tolist()
+    faces = records['face'].tolist()
+    ears = ears.tolist()
+    times = timestamps.tolist()
+    for start, end in zip(starts[:-1], starts[1:]):
+        now = times[start]
+        if faces[start] == NO_FACE:
+            tracks.evict(now)
+            continue
+        for face, i in zip(tracks.assign(boxes[start:end], now), range(start, end)):
+            for event in state.update(ears[i], now, face):
+                events.append((now, face.track_id, event))
+
+    kinds = [event[0] for _, _, event in events]
+    return {
+        'frames': len(starts) - 1,
+        'duracion_s': float(timestamps[-1] - timestamps[0]),
+        'rostros': tracks.next_id,
+        'cierres': kinds.count(EVENT_CLOSED),
+        'pitidos': kinds.count(EVENT_BEEP),
+        'alertas': kinds.count(EVENT_ALERT),
+        'fatigas': kinds.count(EVENT_FATIGUE),
+        'eventos': events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce sesiones de landmarks grabadas con distintos umbrales")
+    parser.add_argument('sesiones', nargs='+', help="Archivos de sesión (.lmk)")
+    parser.add_argument('--umbrales', nargs='+', type=float, default=[0.25],
+                        help="Valores de ear_threshold a probar")
+    parser.add_argument('--alerta', type=float, default=4.0, help="Segundos con ojos cerrados hasta la alerta")
+    parser.add_argument('--cooldown', type=float, default=1.0, help="Segundos entre pitidos")
+    parser.add_argument('--perclos', type=float, default=0.15, help="PERCLOS a partir del cual se avisa de fatiga")
+    parser.add_argument('--ventana', type=float, default=60.0, help="Ventana en segundos de PERCLOS y parpadeos")
+    args = parser.parse_args()
+
+    print(f"{'sesion':<24} {'umbral':>7} {'frames':>8} {'rostros':>8} {'cierres':>8} {'pitidos':>8} {'alertas':>8} {'fatigas':>8} {'x real':>9}")
+    for path in args.sesiones:
+        records = load_session(path)
+        ears = session_ears(records)
+        for threshold in args.umbrales:
+            start = time.perf_counter()
+            r = replay_session(records, ears, ear_threshold=threshold,
+                               beep_cooldown=args.cooldown, alert_after=args.alerta,
+                               perclos_threshold=args.perclos, metrics_window=args.ventana)
+            took = time.perf_counter() - start
+            speed = r['duracion_s'] / took if took > 0 else float('inf')
+            print(f"{os.path.basename(path):<24} {threshold:>7.3f} {r['frames']:>8} {r['rostros']:>8} {r['cierres']:>8} "
+                  f"{r['pitidos']:>8} {r['alertas']:>8} {r['fatigas']:>8} {speed:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()